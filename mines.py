@@ -1,17 +1,67 @@
 import itertools
 import copy
 import random
-import pyautogui
+import importlib
 import math
 import sys
 import getopt
 import time
 import os
+import concurrent.futures
+import contextlib
+import json
+import struct
+import threading
+import tracemalloc
 
-from PIL import Image, ImageDraw
-from collections import namedtuple, deque, defaultdict
+import numpy as np
+from collections import namedtuple, deque, defaultdict, OrderedDict
 from fractions import Fraction
 
+class LazyModule:
+    """Stands for the module called (name), which is only imported when one of
+    its attributes is first looked up. Importing (pyautogui) connects to the
+    display, which the commands that work on saved images and simulated games
+    do without."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pyautogui = LazyModule('pyautogui')
+
+# The tables made by (neighbor_table), by dimensions
+_neighbor_tables = {}
+
+def neighbor_table(nrows, ncols):
+    """Returns the neighbors of every box of a board with (nrows) rows and
+    (ncols) columns, as a tuple of rows holding a tuple of rowcols per box.
+    The tables are made once per dimensions and shared."""
+    if (nrows, ncols) not in _neighbor_tables:
+        _neighbor_tables[nrows, ncols] = tuple(
+            tuple(tuple((nrow, ncol)
+                        for ncol in range(max(col-1, 0), min(col+2, ncols))
+                        for nrow in range(max(row-1, 0), min(row+2, nrows))
+                        if (nrow, ncol) != (row, col))
+                  for col in range(ncols))
+            for row in range(nrows))
+    return _neighbor_tables[nrows, ncols]
+
+def neighbor_counts(mask):
+    """Returns an array of the shape of the 2D boolean array (mask), holding
+    for every box the number of its neighbors at which (mask) is true. This
+    is a 3x3 convolution, done as a sum of shifted copies of (mask), padded
+    so that the boxes on the edges get no neighbors from outside."""
+    nrows, ncols = mask.shape
+    padded = np.pad(mask, 1).astype(np.int8)
+    return sum(padded[1+drow:1+drow+nrows, 1+dcol:1+dcol+ncols]
+               for drow in (-1, 0, 1) for dcol in (-1, 0, 1)) - padded[1:-1, 1:-1]
+
 class Board:
     Boundary = namedtuple('Boundary', 'miny maxy minx maxx')
 
@@ -30,6 +80,19 @@ class Board:
     MINE = 'MINE'
     # The box contained a mine and was opened.
     HIT = 'HIT'
+
+    # ════════════════════════════════════════
+    # Box values are stored in a numpy array of int8 codes. Digits are stored
+    # as themselves, the other values have the codes below.
+    EMPTY_CODE = 0
+    HIDDEN_CODE = -1
+    SAFE_CODE = -2
+    MINE_CODE = -3
+    HIT_CODE = -4
+    # Maps box values to their codes and back.
+    CODES = {EMPTY: EMPTY_CODE, HIDDEN: HIDDEN_CODE, SAFE: SAFE_CODE,
+             MINE: MINE_CODE, HIT: HIT_CODE, **{digit: digit for digit in range(1, 9)}}
+    VALUES = {code: value for value, code in CODES.items()}
     
     # ════════════════════════════════════════
     # Colors. These colors were manually discovered,
@@ -59,18 +122,62 @@ class Board:
                  FOUR_COLOR: 4, FIVE_COLOR: 5, SIX_COLOR: 6, 
                  SEVEN_COLOR: 7, HIDDEN_COLOR: HIDDEN,
                  EMPTY_COLOR: EMPTY, NOTHIT_COLOR: HIT, HIT_COLOR: HIT}
+    # The colors which matter when classifying a whole screenshot at once (see
+    # Board.classify). Pixels are coded by their index in this tuple plus one,
+    # with zero standing for any other color.
+    PALETTE = (BORDER_COLOR, CURSOR_COLOR, MINE_FLAG_COLOR) + tuple(COLOR_MAP)
+    _palette_table = None
 
     def __init__(self, img, topleft, nrows, ncols, N):
         """(img) must be an image of a completely hidden board. (topleft) must be
         a pixel coordinate that is within the top-left box. (nrows, ncols) are the
         dimensions of the board. (N) is the number of mines within the board."""
-        self._matr = [[self.HIDDEN for col in range(ncols)] for row in range(nrows)]
+        self._init_boxes(nrows, ncols, N)
         self._set_boundaries(img, topleft, nrows, ncols)
+        self.update(img)
+
+    @classmethod
+    def calibrated(cls, img, N, nrows=None, ncols=None, path=None):
+        """Returns a board of (N) mines read from (img), whose grid is found
+        by (calibrate) instead of being walked from a pixel within the top-left
+        box. (nrows, ncols) and (path) are passed on to (calibrate)."""
+        ybounds, xbounds = calibrate(img, nrows, ncols, path)
+        board = cls.__new__(cls)
+        board._init_boxes(len(ybounds), len(xbounds), N)
+        board._set_grid(ybounds, xbounds)
+        board.update(img)
+        return board
+
+    @classmethod
+    def blank(cls, nrows, ncols, N):
+        """Returns a board whose boxes are all hidden and which is not tied to
+        the screen: it has no boundaries and is updated through (Board.apply)
+        instead of from screenshots."""
+        board = cls.__new__(cls)
+        board._init_boxes(nrows, ncols, N)
+        board.boundaries = None
+        return board
+
+    @classmethod
+    def from_codes(cls, codes, N):
+        """Returns a (Board.blank) board of (N) mines whose boxes have the
+        (codes), a 2D array (see Board.CODES)."""
+        nrows, ncols = codes.shape
+        board = cls.blank(nrows, ncols, N)
+        board._codes = np.array(codes, dtype=np.int8)
+        board._build_indexes()
+        board.remaining = N - len(board._mines)
+        return board
+
+    def _init_boxes(self, nrows, ncols, N):
         self.nrows = nrows
         self.ncols = ncols
+        self._codes = np.full((nrows, ncols), self.HIDDEN_CODE, dtype=np.int8)
+        self._neighbor_table = neighbor_table(nrows, ncols)
+        self._build_indexes()
+        self._labels_cache = (None, None)
         self.total = self.remaining = N
         self.hit_mine = False # Whether a mine has been hit
-        self.update(img)
 
     def _set_boundaries(self, img, topleft, nrows, ncols):
         """This function creates (self.boundaries), which is a mapping from a
@@ -103,36 +210,270 @@ class Board:
             minx = x
             x, y = move_to_border(x, y, 1, 0)
             xbounds.append((minx, x-1))
-        rowcols = itertools.product(range(nrows), range(ncols))
+        self._set_grid(ybounds, xbounds)
+
+    def _set_grid(self, ybounds, xbounds):
+        """Creates (self.boundaries) from (ybounds), the pairs (MINY, MAXY) of
+        the rows, and (xbounds), the pairs (MINX, MAXX) of the columns."""
+        rowcols = itertools.product(range(len(ybounds)), range(len(xbounds)))
         boundaries = (Board.Boundary(*yb, *xb)
                       for yb, xb in itertools.product(ybounds, xbounds))
         self.boundaries = dict(zip(rowcols, boundaries))
 
+    def _build_indexes(self):
+        """Builds the state indexes from (self._codes). The indexes are sets of
+        the hidden, safe, mine and digit rowcols, together with (self._frontier),
+        the set of digit rowcols which have hidden neighbors. (self._nhidden)
+        holds the number of hidden neighbors of every box. From then on
+        (__setitem__) keeps all of them up to date."""
+        codes = self._codes
+        self._hidden = self._rowcols_where(codes == self.HIDDEN_CODE)
+        self._safe = self._rowcols_where(codes == self.SAFE_CODE)
+        self._mines = self._rowcols_where(codes == self.MINE_CODE)
+        self._digits = self._rowcols_where(codes > 0)
+        self._nhidden = self.hidden_counts().tolist()
+        self._frontier = set(rowcol for rowcol in self._digits
+                             if self._nhidden[rowcol[0]][rowcol[1]])
+
+    def _index_of(self, code):
+        """Returns the state index which holds the rowcols with (code), or None
+        if such rowcols are not indexed."""
+        if code > 0:
+            return self._digits
+        elif code == self.HIDDEN_CODE:
+            return self._hidden
+        elif code == self.SAFE_CODE:
+            return self._safe
+        elif code == self.MINE_CODE:
+            return self._mines
+        return None
+
     def __getitem__(self, rowcol):
         row, col = rowcol
-        return self._matr[row][col]
+        return self.VALUES[self._codes[row, col]]
 
     def __setitem__(self, rowcol, value):
         row, col = rowcol
-        self._matr[row][col] = value
+        old, new = self._codes[row, col], self.CODES[value]
+        if old == new:
+            return
+        self._codes[row, col] = new
+        old_index, new_index = self._index_of(old), self._index_of(new)
+        if old_index is not None:
+            old_index.discard(rowcol)
+        if new_index is not None:
+            new_index.add(rowcol)
+        # ════════════════════════════════════════
+        # Maintain the hidden neighbor counts and the frontier
+        if old == self.HIDDEN_CODE or new == self.HIDDEN_CODE:
+            delta = 1 if new == self.HIDDEN_CODE else -1
+            for neigh in self.neighbors(rowcol):
+                nrow, ncol = neigh
+                self._nhidden[nrow][ncol] += delta
+                if neigh in self._digits:
+                    if self._nhidden[nrow][ncol]:
+                        self._frontier.add(neigh)
+                    else:
+                        self._frontier.discard(neigh)
+        if new > 0 and self._nhidden[row][col]:
+            self._frontier.add(rowcol)
+        elif old > 0:
+            self._frontier.discard(rowcol)
             
-    def update(self, img):
+    def update(self, img, origin=(0, 0), rowcols=None):
         """Updates boxes based on (img). Returns a list of the rowcols which
-        have changed, or None in case a mine has been hit."""
+        have changed, or None in case a mine has been hit. (origin) is the
+        screen coordinate of the top-left pixel of (img), which is useful when
+        only a region of the screen is captured (see Board.region). If
+        (rowcols) is given, only those boxes are examined, and (img) needs to
+        contain only them."""
         self.last_update_img = img
-        pix = img.load()
-        changed = [] # the list of changed rowcols
-        for rowcol in self.unknown_rowcols:
-            value = self.value_at(pix, rowcol)
-            if value is self.HIT:
-                self.hit_mine = True
-                return None
-            if value is not self.HIDDEN:
+        self.last_update_origin = origin
+        codes = self.classify(img, origin, rowcols)
+        unknown = (self._codes == self.HIDDEN_CODE) | (self._codes == self.SAFE_CODE)
+        if rowcols is not None:
+            selected = np.zeros_like(unknown)
+            selected[tuple(zip(*rowcols))] = True
+            unknown &= selected
+        if (codes[unknown] == self.HIT_CODE).any():
+            self.hit_mine = True
+            return None
+        # the list of changed rowcols
+        changed = self._rowcols_where(unknown & (codes != self.HIDDEN_CODE))
+        for rowcol in changed:
+            self[rowcol] = self.VALUES[codes[rowcol]]
+        self.remaining = self.total - len(self._mines)
+        return list(changed)
+
+    def apply(self, values):
+        """Like (update), but the new values come from (values), a mapping from
+        rowcols to box values, instead of from a screenshot."""
+        if any(value is self.HIT for value in values.values()):
+            self.hit_mine = True
+            return None
+        changed = []
+        for rowcol, value in values.items():
+            if self.is_unknown(rowcol) and value is not self.HIDDEN:
                 self[rowcol] = value
                 changed.append(rowcol)
-        self.remaining = self.total - len(self.mine_rowcols)
+        self.remaining = self.total - len(self._mines)
         return changed
 
+    def classify(self, img, origin=(0, 0), rowcols=None):
+        """Classifies boxes in (img) in one batch. Returns an array of shape
+        (nrows, ncols) holding the code (see Board.CODES) of every box's value.
+        (origin) is as in (update). If (rowcols) is given, only the boxes in the
+        smallest block of rows and columns which contains them are classified,
+        and the boxes outside of that block are left as HIDDEN_CODE.
+
+        This follows the same rules as (value_at), but instead of walking
+        pixels it works on per-box color histograms. The background of a box is
+        its most frequent background color, which ignores the rounded corners
+        (BORDER_COLOR) and the colors of the symbols drawn on top. ValueError is
+        raised if some box has no background color at all."""
+        block = self._block(rowcols)
+        minrow, maxrow, mincol, maxcol = block
+        nrows, ncols = maxrow - minrow + 1, maxcol - mincol + 1
+        left, top, width, height = self._region(block)
+        left, top = left - origin[0], top - origin[1]
+        rgb = np.asarray(img)[top:top+height, left:left+width]
+        colors = self._color_codes(rgb)
+        labels, midrows, midxs = self._box_labels(block)
+        nboxes, ncolors = nrows * ncols, len(self.PALETTE) + 1
+        code_of = {color: self.PALETTE.index(color) + 1 for color in self.PALETTE}
+        # ════════════════════════════════════════
+        # hist[box, color] is the number of pixels of (color) in (box). Pixels
+        # outside of boxes are counted in an extra box which is dropped.
+        hist = np.bincount((labels * ncolors + colors).ravel(),
+                           minlength=(nboxes+1) * ncolors)
+        hist = hist.reshape(nboxes+1, ncolors)[:nboxes]
+        # ════════════════════════════════════════
+        # Whether the mine flag symbol appears on the middle vertical line.
+        # Pixels outside of boxes are counted in an extra row which is dropped.
+        is_flag = colors[:, midxs] == code_of[self.MINE_FLAG_COLOR]
+        flag_labels = midrows[:, None] * ncols + np.arange(ncols)
+        flagged = np.bincount(flag_labels.ravel(), weights=is_flag.ravel(),
+                              minlength=nboxes + ncols)[:nboxes] > 0
+        # ════════════════════════════════════════
+        # Find the background colors and translate them to box values
+        background_colors = np.array([code_of[self.CURSOR_COLOR]] +
+                                     [code_of[color] for color in self.COLOR_MAP])
+        has_background = hist[:, background_colors].any(axis=1)
+        if not has_background.all():
+            row, col = divmod(int(np.argmin(has_background)), ncols)
+            raise ValueError(f'Could not get the value at position {(minrow+row, mincol+col)}')
+        background = background_colors[hist[:, background_colors].argmax(axis=1)]
+        code_lookup = np.zeros(ncolors, dtype=np.int8)
+        code_lookup[code_of[self.CURSOR_COLOR]] = self.HIDDEN_CODE
+        for color, value in self.COLOR_MAP.items():
+            code_lookup[code_of[color]] = self.CODES[value]
+        codes = code_lookup[background]
+        # The background color of a box that has a mine that was clicked is the
+        # same as the color of a hidden box on top of the cursor hovers.
+        hit = hist[:, code_of[self.HIT_COLOR]] > 0
+        codes[(background == code_of[self.CURSOR_COLOR]) & hit] = self.HIT_CODE
+        # The color of a hidden box is the same as the background color of a
+        # box marked as having a mine.
+        codes[(background == code_of[self.HIDDEN_COLOR]) & flagged] = self.MINE_CODE
+        result = np.full((self.nrows, self.ncols), self.HIDDEN_CODE, dtype=np.int8)
+        result[minrow:maxrow+1, mincol:maxcol+1] = codes.reshape(nrows, ncols)
+        return result
+
+    @classmethod
+    def _color_codes(cls, rgb):
+        """Returns a 2D array which holds for every pixel in the RGB array (rgb)
+        the index of its color in (Board.PALETTE) plus one, or zero if the color
+        is not in the palette. The colors in the palette differ in their red and
+        green components, so these are looked up in a table and only the blue
+        component needs to be checked."""
+        if cls._palette_table is None:
+            table = np.zeros((256, 256), dtype=np.intp)
+            blues = np.zeros(len(cls.PALETTE) + 1, dtype=np.uint8)
+            for code, (r, g, b) in enumerate(cls.PALETTE, 1):
+                assert not table[r, g], 'PALETTE colors must differ in red or green'
+                table[r, g], blues[code] = code, b
+            cls._palette_table = (table.ravel(), blues)
+        table, blues = cls._palette_table
+        index = rgb[..., 0].astype(np.intp)
+        index <<= 8
+        index |= rgb[..., 1]
+        colors = table[index]
+        colors[blues[colors] != rgb[..., 2]] = 0
+        return colors
+
+    def _box_labels(self, block):
+        """Returns a triple (LABELS, MIDROWS, MIDXS) used for classifying the
+        pixels within the region of (block). LABELS maps every pixel to the
+        index of the box within the block which contains it (row*ncols + col,
+        with rows and columns counted from the block's corner), and to the
+        number of boxes in the block if there is no such box. MIDXS are the x
+        coordinates of the middle vertical lines of the block's columns, which
+        is where the mine flag symbol is looked for, and MIDROWS maps every y
+        coordinate to the row of the box whose middle line contains it, or to
+        the number of rows. All coordinates are relative to the block's
+        region. The result for the whole board is cached."""
+        if block == self._labels_cache[0]:
+            return self._labels_cache[1]
+        minrow, maxrow, mincol, maxcol = block
+        nrows, ncols = maxrow - minrow + 1, maxcol - mincol + 1
+        left, top, width, height = self._region(block)
+        row_of_y = np.full(height, nrows)
+        midrows = np.full(height, nrows)
+        for row in range(nrows):
+            b = self.boundaries[minrow+row, mincol]
+            row_of_y[b.miny-top:b.maxy-top+1] = row
+            midrows[b.miny-top:b.maxy-top] = row
+        col_of_x = np.full(width, -1)
+        midxs = np.empty(ncols, dtype=np.intp)
+        for col in range(ncols):
+            b = self.boundaries[minrow, mincol+col]
+            col_of_x[b.minx-left:b.maxx-left+1] = col
+            midxs[col] = (b.minx+b.maxx)//2 - left
+        inside = (row_of_y < nrows)[:, None] & (col_of_x >= 0)[None, :]
+        labels = np.where(inside, row_of_y[:, None] * ncols + col_of_x[None, :],
+                          nrows * ncols)
+        result = (labels, midrows, midxs)
+        if block == (0, self.nrows-1, 0, self.ncols-1):
+            self._labels_cache = (block, result)
+        return result
+
+    def _block(self, rowcols=None):
+        """Returns a tuple (MINROW, MAXROW, MINCOL, MAXCOL) describing the
+        smallest block of rows and columns which contains (rowcols), or the
+        whole board if (rowcols) is None."""
+        if rowcols is None:
+            return (0, self.nrows-1, 0, self.ncols-1)
+        rows, cols = zip(*rowcols)
+        return (min(rows), max(rows), min(cols), max(cols))
+
+    def _region(self, block):
+        """Returns the screen region (LEFT, TOP, WIDTH, HEIGHT) of (block)."""
+        minrow, maxrow, mincol, maxcol = block
+        first, last = self.boundaries[minrow, mincol], self.boundaries[maxrow, maxcol]
+        return (first.minx, first.miny,
+                last.maxx - first.minx + 1, last.maxy - first.miny + 1)
+
+    def region(self, rowcols=None):
+        """Returns the screen region (LEFT, TOP, WIDTH, HEIGHT) which contains
+        the boxes at (rowcols), or all of the boxes if (rowcols) is None. This
+        is the format taken by (pyautogui.screenshot)."""
+        return self._region(self._block(rowcols))
+
+    def annotate(self, mines, safe):
+        """Returns a copy of the image of the last update with the boxes at
+        (mines) drawn in black and those at (safe) drawn in blue."""
+        from PIL import ImageDraw
+        img = self.last_update_img.copy()
+        left, top = self.last_update_origin
+        draw = ImageDraw.Draw(img)
+        for rowcol in mines:
+            b = self.boundaries[rowcol]
+            draw.rectangle((b.minx-left, b.miny-top, b.maxx-left, b.maxy-top), (0,0,0))
+        for rowcol in safe:
+            b = self.boundaries[rowcol]
+            draw.rectangle((b.minx-left, b.miny-top, b.maxx-left, b.maxy-top), (0,38,255))
+        return img
+
     def value_at(self, pix, rowcol):
         """A helper function. For the box at (rowcol), we get the value based on
         the pixmap (pix), which is the return value of (IMAGE.load()). ValueError
@@ -175,48 +516,72 @@ class Board:
         raise ValueError(f'Could not get the value at position {rowcol}')
 
     def neighbors(self, rowcol):
+        """Returns the tuple of the rowcols around (rowcol), from the shared
+        (neighbor_table), so it must not be changed."""
         row, col = rowcol
-        candidates = ((row-1, col-1), (row, col-1), (row+1, col-1),
-                      (row-1, col), (row+1, col),
-                      (row-1, col+1), (row, col+1), (row+1, col+1))
-        return (rowcol for rowcol in candidates
-                if 0 <= rowcol[0] < self.nrows and 0 <= rowcol[1] < self.ncols)
+        return self._neighbor_table[row][col]
 
+    # The state indexes (see _build_indexes) answer these without looking
+    # at the values of the boxes.
     def digit_neighbors(self, rowcol):
-        return set(neigh for neigh in self.neighbors(rowcol)
-                   if type(self[neigh]) is int)
+        digits = self._digits
+        return {neigh for neigh in self.neighbors(rowcol) if neigh in digits}
 
     def mine_neighbors(self, rowcol):
-        return set(neigh for neigh in self.neighbors(rowcol)
-                   if self[neigh] is Board.MINE)
+        mines = self._mines
+        return {neigh for neigh in self.neighbors(rowcol) if neigh in mines}
 
     def hidden_neighbors(self, rowcol):
-        return set(neigh for neigh in self.neighbors(rowcol)
-                   if self[neigh] is Board.HIDDEN)
+        hidden = self._hidden
+        return {neigh for neigh in self.neighbors(rowcol) if neigh in hidden}
+
+    def hidden_counts(self):
+        """Returns an array of shape (nrows, ncols) holding the number of
+        hidden neighbors of every box."""
+        return neighbor_counts(self._codes == self.HIDDEN_CODE)
+
+    def mine_counts(self):
+        """Returns an array of shape (nrows, ncols) holding the number of
+        neighbors of every box which are marked as mines."""
+        return neighbor_counts(self._codes == self.MINE_CODE)
+
+    def residuals(self):
+        """Returns an array of shape (nrows, ncols) holding, for every D-box,
+        the number of mines left among its hidden neighbors: its digit less
+        its neighbors which are marked as mines. The other boxes hold 0."""
+        codes = self._codes
+        return np.where(codes > 0, codes - self.mine_counts(), 0)
 
     @property
     def rowcols(self):
         """Returns an iterator of the rowcols available in SELF"""
         return set(itertools.product(range(self.nrows), range(self.ncols)))
     
+    @staticmethod
+    def _rowcols_where(mask):
+        """Returns the set of rowcols at which the boolean array (mask) is true."""
+        return set(map(tuple, np.argwhere(mask).tolist()))
+
     @property
     def hidden_rowcols(self):
-        return set(rowcol for rowcol in self.unknown_rowcols
-                   if self[rowcol] is not self.SAFE)
+        return set(self._hidden)
 
     @property
     def mine_rowcols(self):
-        return set(rowcol for rowcol in self.rowcols
-                   if self[rowcol] is self.MINE)
+        return set(self._mines)
 
     @property
     def unknown_rowcols(self):
-        return set(filter(self.is_unknown, self.rowcols))
+        return self._hidden | self._safe
 
     @property
     def digit_rowcols(self):
-        return set(rowcol for rowcol in self.rowcols
-                   if type(self[rowcol]) is int)
+        return set(self._digits)
+
+    @property
+    def frontier_rowcols(self):
+        """The digit rowcols which have hidden neighbors."""
+        return set(self._frontier)
 
     def getxy(self, rowcol):
         """Returns a screen coordinate which is within the box at (rowcol)."""
@@ -252,36 +617,286 @@ class Board:
 
     @property
     def all_hidden(self):
-        return len(self.hidden_rowcols) == self.nrows * self.ncols
+        return len(self._hidden) == self.nrows * self.ncols
+
+# Calibration
+# ════════════════════════════════════════
+
+# The file where (calibrate) remembers the grids it found
+CALIBRATION_FILE = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'mines', 'calibration.json')
+
+def _runs(line):
+    """Returns the list of pairs (START, END) of the runs of True values in
+    the 1D boolean array (line), ends included."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], line, [False])).astype(np.int8)))
+    return list(zip(edges[0::2].tolist(), (edges[1::2] - 1).tolist()))
+
+def _regular_runs(runs, count=None):
+    """Returns the longest stretch of consecutive (runs) which have the same
+    length and are the same distance apart, give or take a pixel, like the
+    rows or columns of a grid. If (count) is given, the stretch must have
+    that many runs. Raises ValueError if there is no such stretch."""
+    stretches = []
+    start = 0
+    while start < len(runs):
+        end = start + 1
+        if end < len(runs):
+            length, pitch = runs[start][1] - runs[start][0], runs[end][0] - runs[start][0]
+            while (end < len(runs) and abs(runs[end][1] - runs[end][0] - length) <= 1
+                   and abs(runs[end][0] - runs[end-1][0] - pitch) <= 1):
+                end += 1
+        stretches.append(runs[start:end])
+        # The run which broke the stretch may start the next one with the
+        # run before it
+        start = max(start + 1, end - 1)
+    if count is not None:
+        stretches = [stretch for stretch in stretches if len(stretch) == count]
+    if not stretches:
+        raise ValueError('No grid of boxes found')
+    return max(stretches, key=len)
+
+# How many of the largest BORDER_COLOR regions of a screenshot (detect_grid)
+# looks for the board in, largest first
+GRID_REGIONS_TRIED = 3
+
+def _regions(mask):
+    """Returns the bounding boxes (MINY, MAXY, MINX, MAXX) of the connected
+    regions of True values in the 2D boolean array (mask), the ones with the
+    most pixels first. The regions are made of the horizontal runs of True
+    values: runs on consecutive rows which overlap are connected, and every
+    run takes the smallest label of the runs it is connected to until the
+    labels settle."""
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    ys, xs = np.nonzero(np.diff(padded, axis=1))
+    rows, starts, ends = ys[0::2], xs[0::2], xs[1::2] - 1
+    if not len(rows):
+        return []
+    # ════════════════════════════════════════
+    # Pair every run with the runs of the next row which overlap it. The runs
+    # are in row order and then in column order, so those are consecutive.
+    stride = width + 1
+    first = np.searchsorted(rows*stride + ends, (rows+1)*stride + starts, 'left')
+    last = np.searchsorted(rows*stride + starts, (rows+1)*stride + ends, 'right')
+    counts = np.maximum(last - first, 0)
+    upper = np.repeat(np.arange(len(rows)), counts)
+    lower = (np.repeat(first - np.cumsum(counts) + counts, counts)
+             + np.arange(counts.sum()))
+    # ════════════════════════════════════════
+    # Propagate the smallest labels, jumping along the chains of labels
+    labels = np.arange(len(rows))
+    while True:
+        smallest = np.minimum(labels[upper], labels[lower])
+        new = labels.copy()
+        np.minimum.at(new, upper, smallest)
+        np.minimum.at(new, lower, smallest)
+        new = new[new]
+        if (new == labels).all():
+            break
+        labels = new
+    sizes = np.bincount(labels, weights=ends - starts + 1)
+    result = []
+    for label in np.argsort(-sizes, kind='stable'):
+        if sizes[label] == 0:
+            break
+        runs = labels == label
+        result.append((int(rows[runs].min()), int(rows[runs].max()),
+                       int(starts[runs].min()), int(ends[runs].max())))
+    return result
+
+def detect_grid(img, nrows=None, ncols=None):
+    """Finds the grid of boxes of the board in the screenshot (img), without
+    being told where it is. Returns a pair (YBOUNDS, XBOUNDS) of the lists of
+    pairs (MIN, MAX) of the rows and columns of boxes. If (nrows) or (ncols)
+    is given, only grids with that many rows or columns are looked for.
+    Raises ValueError if no grid is found.
+
+    The board lies within the background of the game window, which is the
+    largest region of Board.BORDER_COLOR on the screen unless other windows
+    have the same color, so the GRID_REGIONS_TRIED largest regions (see
+    _regions) are searched in turn (see _detect_grid_within).
+    """
+    rgb = np.asarray(img.convert('RGB') if img.mode != 'RGB' else img)
+    # Comparing the channels one by one is several times faster than
+    # comparing whole pixels
+    red, green, blue = Board.BORDER_COLOR
+    boxes = (rgb[..., 0] != red) | (rgb[..., 1] != green) | (rgb[..., 2] != blue)
+    for miny, maxy, minx, maxx in _regions(~boxes)[:GRID_REGIONS_TRIED]:
+        try:
+            ybounds, xbounds = _detect_grid_within(boxes[miny:maxy+1, minx:maxx+1],
+                                                   nrows, ncols)
+        except ValueError:
+            continue
+        return ([(start + miny, end + miny) for start, end in ybounds],
+                [(start + minx, end + minx) for start, end in xbounds])
+    raise ValueError('No grid of boxes found')
+
+def _detect_grid_within(boxes, nrows=None, ncols=None):
+    """Returns the grid (YBOUNDS, XBOUNDS) of the boxes in (boxes), a 2D
+    boolean array which is true at the pixels which are not
+    Board.BORDER_COLOR, in its coordinates (see detect_grid). The columns of
+    the board are the regular stretch of columns of pixels which are mostly
+    boxes, and its rows are found the same way within those columns. The
+    exact bounds are then read along the middle lines of the first row and
+    column, as (Board._set_boundaries) does."""
+    profile = boxes.sum(axis=0)
+    xruns = _regular_runs(_runs(profile > profile.max() / 2), ncols)
+    minx, maxx = xruns[0][0], xruns[-1][1]
+    profile = boxes[:, minx:maxx+1].sum(axis=1)
+    yruns = _regular_runs(_runs(profile > profile.max() / 2), nrows)
+    miny, maxy = yruns[0][0], yruns[-1][1]
+    midy, midx = sum(yruns[0]) // 2, sum(xruns[0]) // 2
+    xbounds = [(start, end) for start, end in _runs(boxes[midy])
+               if start <= maxx and end >= minx]
+    ybounds = [(start, end) for start, end in _runs(boxes[:, midx])
+               if start <= maxy and end >= miny]
+    if len(xbounds) != len(xruns) or len(ybounds) != len(yruns):
+        raise ValueError('The grid of boxes is not regular')
+    return ybounds, xbounds
+
+def _box_colored(pixels):
+    """Whether any of the array of RGB (pixels) has the background color of
+    some box."""
+    colors = np.array([Board.CURSOR_COLOR, *Board.COLOR_MAP], dtype=pixels.dtype)
+    return bool((pixels.reshape(-1, 1, 3) == colors).all(axis=2).any())
+
+def _beyond(bounds, size):
+    """Returns the middles of the rows or columns which would come one pitch
+    before the first and one pitch after the last of (bounds) if the grid
+    went on, among those within (size) pixels."""
+    mids = [sum(b) // 2 for b in bounds]
+    pitch = mids[1] - mids[0] if len(mids) > 1 else bounds[0][1] - bounds[0][0] + 2
+    return [mid for mid in (mids[0] - pitch, mids[-1] + pitch) if 0 <= mid < size]
+
+def grid_matches(img, grid):
+    """Whether the grid (YBOUNDS, XBOUNDS) fits the boxes in the screenshot
+    (img): the middle of every box is not Board.BORDER_COLOR, while the lines
+    just outside the rows and columns are, and nothing which has the color of
+    a box is where a row or column before or after the grid would be. The
+    last check tells a grid from the corner of a larger board."""
+    ybounds, xbounds = grid
+    rgb = np.asarray(img)
+    height, width = rgb.shape[:2]
+    if ybounds[-1][1] + 1 >= height or xbounds[-1][1] + 1 >= width:
+        return False
+    ys, xs = [sum(b) // 2 for b in ybounds], [sum(b) // 2 for b in xbounds]
+    border = np.array(Board.BORDER_COLOR, dtype=rgb.dtype)
+    outside_ys = [ybounds[0][0] - 1] + [maxy + 1 for _, maxy in ybounds]
+    outside_xs = [xbounds[0][0] - 1] + [maxx + 1 for _, maxx in xbounds]
+    return bool((rgb[np.ix_(ys, xs)] != border).any(axis=2).all()
+                and (rgb[np.ix_(outside_ys, xs)] == border).all()
+                and (rgb[np.ix_(ys, outside_xs)] == border).all()
+                and not _box_colored(rgb[np.ix_(_beyond(ybounds, height), xs)])
+                and not _box_colored(rgb[np.ix_(ys, _beyond(xbounds, width))]))
+
+def calibrate(img, nrows=None, ncols=None, path=None):
+    """Returns the grid (YBOUNDS, XBOUNDS) of the board in the screenshot
+    (img), as (detect_grid) does. If (path) is given, the grids found are
+    cached in the JSON file there, keyed by the size of the screenshot and
+    the dimensions of the board. A cached grid of the size of (img), and of
+    (nrows, ncols) if they are given, which still fits the screenshot (see
+    grid_matches) is returned without detecting it again."""
+    width, height = img.size
+    screen = f'{width}x{height}'
+    cache = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as file:
+            cache = json.load(file)
+    if nrows is not None and ncols is not None:
+        keys = [f'{screen} {nrows}x{ncols}']
+    else:
+        keys = sorted(key for key in cache if key.split()[0] == screen)
+    for key in keys:
+        grid = cache.get(key)
+        if (grid is not None and (nrows is None or len(grid[0]) == nrows)
+                and (ncols is None or len(grid[1]) == ncols) and grid_matches(img, grid)):
+            return [list(map(tuple, bounds)) for bounds in grid]
+    grid = detect_grid(img, nrows, ncols)
+    if path is not None:
+        cache[f'{screen} {len(grid[0])}x{len(grid[1])}'] = grid
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(cache, file)
+        os.replace(path + '.tmp', path)
+    return grid
 
 # Engines
 # ════════════════════════════════════════
 
+class Timeout(Exception):
+    """Raised by the searches which run past their deadline."""
+
+# How many search steps are taken between two looks at the clock. A step can
+# take a tenth of a millisecond on a wide frontier, and a look takes much
+# less than a microsecond.
+DEADLINE_CHECK_STEPS = 32
+
 class Engine:
+    # The (time.time) by which (run) should return, or None if there is no
+    # limit. Engines which can take long return what they have found so far
+    # when it is reached (see SequenceEngine).
+    deadline = None
+    # A dict with figures about the last run, such as the sizes of the
+    # components it solved, or None. Written to the profile (see Profiler).
+    stats = None
+    # Whether the safe boxes of the last run were guessed by a risky engine
+    # rather than deduced
+    guessed = False
+
     def run(self):
         """Finds out which rowcols contain mines and which are safe and marks
         them in the board accordingly. Returns a pair of sets (MINES, SAFE)"""
         raise NotImplementedError
 
+    def notify(self, rowcols):
+        """Tells the engine that the boxes at (rowcols) have changed other than
+        through its own marks, e.g. after the board was synced. Engines which
+        keep state across runs use this to bring it up to date."""
+        pass
+
 class GroupsEngine(Engine):
     """
     When an engine is run (via engine.run()), it marks the rowcols which it
     thinks contain mines, and also those which it believes definitely to be free
     of mines. After marking, it then returns the positions so marked so that the
     actuator can modify the real board.
+
+    The collection of groups is kept across runs. A group states how many
+    mines there are among some hidden boxes, which stays true for as long as
+    the boxes stay hidden, so only the groups touching changed boxes are
+    dropped, and only the groups of the digits around them are regenerated.
+
+    The boxes of a group are encoded as an integer bitmask (MASK) over the
+    flat box indexes (row*ncols + col), so subset tests and complements are
+    just a few integer operations.
     """
 
-    Group = namedtuple('Group', 'rowcols N')
-    Collection = namedtuple('Collection', 'groups full_groups empty_groups')
+    Group = namedtuple('Group', 'mask N')
+    # (index) maps a flat box index to the set of groups which contain it,
+    # and (lowest) maps it to the set of groups whose lowest box it is. Any
+    # supergroup of a group contains its lowest box, and any subgroup has its
+    # lowest box among the group's boxes, so these restrict the candidates for
+    # complements to groups which share a box.
+    Collection = namedtuple('Collection', 'groups full_groups empty_groups index lowest')
     
     def __init__(self, board):
         self.board = board
         self.collection = None
+        # the rowcols which changed since the collection was last brought up
+        # to date
+        self.changed = set()
 
     def run(self):
         mines, safe = self._mark_as_mine_or_safe()
+        self.stats = {'groups': len(self.collection.groups)}
         return mines, safe
 
+    def notify(self, rowcols):
+        self.changed.update(rowcols)
+
     def _mark_as_mine_or_safe(self):
         """Marks the rowcols which the engine knows for sure contain
         mines. Returns a pair (marked, safe). The former is a set of the rowcols
@@ -289,17 +904,19 @@ class GroupsEngine(Engine):
         mines, these can be revealed safely."""
         mines, safe = set(), set()
         while True:
-            col = self.new_collection()
+            col = self.update_collection()
             if not (col.full_groups or col.empty_groups):
                 break
             for group in col.full_groups:
-                for rowcol in group.rowcols:
+                for rowcol in self._rowcols(group.mask):
                     self.board.mark_mine(rowcol)
                     mines.add(rowcol)
+                    self.changed.add(rowcol)
             for group in col.empty_groups:
-                for rowcol in group.rowcols:
+                for rowcol in self._rowcols(group.mask):
                     self.board.mark_safe(rowcol)
                     safe.add(rowcol)
+                    self.changed.add(rowcol)
         return mines, safe
     
     def _make_safe_rowcol_guess(self):
@@ -308,115 +925,610 @@ class GroupsEngine(Engine):
         mine."""
         safe_probabilities = {}
         for group in self.collection.groups:
-            group_probability = Fraction(group.N, len(group.rowcols))
-            for rowcol in group.rowcols:
+            group_probability = Fraction(group.N, group.mask.bit_count())
+            for rowcol in self._rowcols(group.mask):
                 current_probability = safe_probabilities.get(rowcol, -1)
                 safe_probabilities[rowcol] = max(current_probability, group_probability)
         return min(safe_probabilities.items(), key=lambda item: item[1])[0]
 
+    @staticmethod
+    def _indexes(mask):
+        """Yields the flat box indexes in (mask), lowest first."""
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def _rowcols(self, mask):
+        return [divmod(index, self.board.ncols) for index in self._indexes(mask)]
+
+    def _mask(self, rowcols):
+        ncols = self.board.ncols
+        mask = 0
+        for row, col in rowcols:
+            mask |= 1 << (row*ncols + col)
+        return mask
+
     def new_collection(self):
         """Creates a new collection based on (self.board) and stores it in
         (self.collection). The function also returns the collection for
         convenience."""
-        pending_groups = self.pending_groups = deque()
-        collection = self.collection = self.Collection(set(), set(), set())
+        self.pending_groups = deque()
+        self.collection = self.Collection(set(), set(), set(),
+                                          defaultdict(set), defaultdict(set))
+        self.changed = set()
         # ════════════════════════════════════════
         # Enqueue the digit boxes' main groups
-        # TODO: this could be made more efficient by keeping track of the digit
-        # boxes which don't have hidden neighbors.
-        for digit_rowcol in self.board.digit_rowcols:
-            # use a frozenset so that the group is hashable so that we can check
-            # if it is in a set
-            rowcols = frozenset(self.board.hidden_neighbors(digit_rowcol))
-            if not rowcols:
-                continue
-            N = self.board[digit_rowcol] - len(list(self.board.mine_neighbors(digit_rowcol)))
-            self.pending_groups.append(self.Group(rowcols, N))
+        for digit_rowcol in self.board.frontier_rowcols:
+            self._enqueue_main_group(digit_rowcol)
+        self._process_pending_groups()
+        return self.collection
+
+    def update_collection(self):
+        """Brings (self.collection) up to date with the changes in (self.changed),
+        creating it if there is none yet. Returns the collection."""
+        if self.collection is None:
+            return self.new_collection()
+        changed, self.changed = self.changed, set()
+        if not changed:
+            return self.collection
         # ════════════════════════════════════════
-        # Process pending groups
+        # Drop the groups touching changed boxes
+        collection = self.collection
+        stale = set()
+        for index in self._indexes(self._mask(changed)):
+            stale.update(collection.index.pop(index, ()))
+        for group in stale:
+            collection.groups.discard(group)
+            collection.full_groups.discard(group)
+            collection.empty_groups.discard(group)
+            indexes = list(self._indexes(group.mask))
+            collection.lowest[indexes[0]].discard(group)
+            for index in indexes:
+                groups = collection.index.get(index)
+                if groups is not None:
+                    groups.discard(group)
+        # ════════════════════════════════════════
+        # Enqueue the main groups of the digit boxes around changed boxes
+        frontier = self.board.frontier_rowcols
+        digits = set()
+        for rowcol in changed:
+            digits.add(rowcol)
+            digits.update(self.board.neighbors(rowcol))
+        for digit_rowcol in digits & frontier:
+            self._enqueue_main_group(digit_rowcol)
+        self._process_pending_groups()
+        return collection
+
+    def _enqueue_main_group(self, digit_rowcol):
+        mask = self._mask(self.board.hidden_neighbors(digit_rowcol))
+        N = self.board[digit_rowcol] - len(self.board.mine_neighbors(digit_rowcol))
+        self.pending_groups.append(self.Group(mask, N))
+
+    def _process_pending_groups(self):
+        pending_groups, collection = self.pending_groups, self.collection
+        index, lowest = collection.index, collection.lowest
         while pending_groups:
             group = pending_groups.popleft()
             if group in collection.groups:
                 # already processed
                 continue
+            mask = group.mask
+            indexes = list(self._indexes(mask))
             # ════════════════════════════════════════
             # Enqueue the complements
-            for other_group in collection.groups:
-                if group.rowcols < other_group.rowcols:
-                    subgroup, supergroup = group, other_group
-                elif other_group.rowcols < group.rowcols:
-                    subgroup, supergroup = other_group, group
-                else:
-                    continue
-                rowcols = supergroup.rowcols - subgroup.rowcols
-                N = supergroup.N - subgroup.N
-                pending_groups.append(self.Group(rowcols, N))
+            for other_group in index.get(indexes[0], ()):
+                # (other_group) contains the lowest box, it may be a supergroup
+                other_mask = other_group.mask
+                if other_mask != mask and mask & other_mask == mask:
+                    pending_groups.append(self.Group(other_mask ^ mask,
+                                                     other_group.N - group.N))
+            for box in indexes:
+                for other_group in lowest.get(box, ()):
+                    # (other_group) starts within the group, it may be a subgroup
+                    other_mask = other_group.mask
+                    if other_mask != mask and mask & other_mask == other_mask:
+                        pending_groups.append(self.Group(mask ^ other_mask,
+                                                         group.N - other_group.N))
             # ════════════════════════════════════════
             # Add the current group
             collection.groups.add(group)
-            if len(group.rowcols) == group.N:
+            for box in indexes:
+                index[box].add(group)
+            lowest[indexes[0]].add(group)
+            if len(indexes) == group.N:
                 collection.full_groups.add(group)
             elif group.N == 0:
                 collection.empty_groups.add(group)
+
+def row_reduce(matrix, eps=1e-9):
+    """Returns the reduced row echelon form of the augmented (matrix), whose
+    last column holds the right-hand sides, without its zero rows. Uses
+    Gaussian elimination with partial pivoting, eliminating each pivot column
+    at once from the other rows which have it. The systems of the frontier
+    are sparse, so these are few. Entries within (eps) of zero are zeroed."""
+    matrix = np.array(matrix, dtype=float)
+    nrows, ncols = matrix.shape
+    row = 0
+    for col in range(ncols - 1):
+        if row == nrows:
+            break
+        pivot = row + np.argmax(np.abs(matrix[row:, col]))
+        if abs(matrix[pivot, col]) < eps:
+            continue
+        matrix[[row, pivot]] = matrix[[pivot, row]]
+        matrix[row] /= matrix[row, col]
+        others = np.flatnonzero(np.abs(matrix[:, col]) >= eps)
+        others = others[others != row]
+        matrix[others] -= np.outer(matrix[others, col], matrix[row])
+        row += 1
+    matrix[np.abs(matrix) < eps] = 0
+    return matrix[:row]
+
+# Frontier components with more boxes than this are left to the next engine
+# by (LinearEngine). The reduction is fast on the sparse systems of the
+# frontier, but takes cubic time at worst.
+LINEAR_MAX_CELLS = 1500
+
+class LinearEngine(Engine):
+    """Treats the frontier as a linear system: every D-box says that the sum
+    of its hidden neighbors, each 1 if it has a mine and 0 otherwise, equals
+    its number of remaining mines. The system of each frontier component is
+    row reduced on its own (see row_reduce), and every row, original or
+    reduced, is checked against the bounds of its left-hand side. If the
+    right-hand side equals the smallest possible sum, the boxes with positive
+    coefficients are safe and the others are mines, and the other way around
+    if it equals the largest. All rows of a component are checked at once on
+    its matrix.
+
+    This takes polynomial time and finds most of what is certain, e.g. the
+    1-2-1 patterns, so it is meant to run before the exhaustive engines.
+    Components with more than LINEAR_MAX_CELLS boxes are skipped. It keeps
+    no state across runs."""
+
+    # Coefficients and sums closer than this are taken to be equal
+    EPS = 1e-9
+
+    def __init__(self, board):
+        self.board = board
+
+    def run(self):
+        board = self.board
+        mines, safe = set(), set()
+        self.stats = {'components': 0, 'rows': 0, 'columns': 0, 'rank': 0, 'skipped': 0}
+        for component in frontier_components(board):
+            if len(component.rowcols) > LINEAR_MAX_CELLS:
+                self.stats['skipped'] += 1
+                continue
+            component_mines, component_safe = self._solve(component)
+            mines.update(component_mines)
+            safe.update(component_safe)
+        for rowcol in mines:
+            board.mark_mine(rowcol)
+        for rowcol in safe:
+            board.mark_safe(rowcol)
+        return mines, safe
+
+    def _solve(self, component):
+        """Returns the pair (MINES, SAFE) of the rowcols of (component) which
+        its linear system forces."""
+        rowcols, constraints = component
+        system = np.zeros((len(constraints), len(rowcols) + 1))
+        for i, (cells, count) in enumerate(constraints):
+            system[i, list(cells)] = 1
+            system[i, -1] = count
+        reduced = row_reduce(system, self.EPS)
+        stats = self.stats
+        stats['components'] += 1
+        stats['rows'] += len(constraints)
+        stats['columns'] += len(rowcols)
+        stats['rank'] += len(reduced)
+        rows = np.vstack([system, reduced])
+        coefs, sums = rows[:, :-1], rows[:, -1]
+        positive, negative = coefs > self.EPS, coefs < -self.EPS
+        lowest = np.where(negative, coefs, 0).sum(axis=1)
+        highest = np.where(positive, coefs, 0).sum(axis=1)
+        at_lowest = (np.abs(sums - lowest) < self.EPS)[:, None]
+        at_highest = (np.abs(sums - highest) < self.EPS)[:, None]
+        mine_mask = ((at_lowest & negative) | (at_highest & positive)).any(axis=0)
+        safe_mask = ((at_lowest & positive) | (at_highest & negative)).any(axis=0)
+        return ({rowcols[j] for j in np.flatnonzero(mine_mask)},
+                {rowcols[j] for j in np.flatnonzero(safe_mask)})
+
+# The radius of the windows of (PatternEngine)
+PATTERN_RADIUS = 2
+# The file which holds the table of (PatternEngine), as made by (save_patterns)
+PATTERNS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patterns.npz')
+# The tables loaded by (load_patterns), by path
+_pattern_tables = {}
+
+class PatternEngine(Engine):
+    """Looks up the window of boxes around each frontier D-box in a table of
+    local patterns, which maps windows to the mines and safe boxes they force.
+    The table is built offline by solving every window met in simulated games
+    exhaustively (see make_patterns), so common deductions like the 1-1 on a
+    wall or the 1-2-1 take a dictionary lookup per D-box.
+
+    A window is the square of radius PATTERN_RADIUS around a D-box. Only the
+    D-boxes of its inner square have all of their neighbors in the window,
+    so only they are taken as constraints, with their remaining mines as the
+    value. The other boxes are either hidden or not, and the ones which do
+    not take part in any constraint are taken as not hidden, as are the boxes
+    beyond the edges of the board. The windows are stored in the form which
+    is the smallest under the rotations and reflections of the square."""
+
+    # The codes of boxes in windows, next to the remaining mines of D-boxes
+    HIDDEN = 9
+    OTHER = 10
+
+    def __init__(self, board, table=None, learn=False):
+        """(table) maps windows to pairs (MINES, SAFE) of bitmasks over the
+        boxes of the window, and defaults to the one in PATTERNS_FILE. If
+        (learn) is true, the windows missing from it are solved and added."""
+        self.board = board
+        self.table = load_patterns() if table is None else table
+        self.learn = learn
+
+    def run(self):
+        board = self.board
+        digits = sorted(board.frontier_rowcols)
+        mines, safe = set(), set()
+        if not digits:
+            return mines, safe
+        radius = PATTERN_RADIUS
+        keys, all_positions = self.canonical(self.windows(board, digits))
+        self.stats = {'windows': len(keys), 'misses': 0}
+        for (row, col), key, positions in zip(digits, keys, all_positions):
+            entry = self.table.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                if not self.learn:
+                    continue
+                entry = self.table[key] = self.solve(key)
+            mine_mask, safe_mask = entry
+            for i, position in enumerate(positions):
+                rowcol = (row - radius + position // (2*radius+1),
+                          col - radius + position % (2*radius+1))
+                if mine_mask >> i & 1:
+                    mines.add(rowcol)
+                elif safe_mask >> i & 1:
+                    safe.add(rowcol)
+        for rowcol in mines:
+            board.mark_mine(rowcol)
+        for rowcol in safe:
+            board.mark_safe(rowcol)
+        return mines, safe
+
+    @classmethod
+    def windows(cls, board, digits):
+        """Returns an array with the windows around (digits), one per D-box,
+        with the normalization described in (PatternEngine)."""
+        radius = PATTERN_RADIUS
+        size = 2*radius + 1
+        codes = board._codes
+        hidden = codes == Board.HIDDEN_CODE
+        outer = np.where(hidden, cls.HIDDEN, cls.OTHER).astype(np.uint8)
+        inner = np.where(codes > 0, board.residuals(), outer).astype(np.uint8)
+        outer = np.pad(outer, radius, constant_values=cls.OTHER)
+        inner = np.pad(inner, radius, constant_values=cls.OTHER)
+        rows, cols = np.array(digits).T
+        view = np.lib.stride_tricks.sliding_window_view
+        windows = view(outer, (size, size))[rows, cols]
+        windows[:, 1:-1, 1:-1] = view(inner, (size, size))[rows, cols][:, 1:-1, 1:-1]
         # ════════════════════════════════════════
-        return collection
+        # Drop the constraints without hidden boxes, then the hidden boxes
+        # outside of every constraint
+        is_hidden = windows == cls.HIDDEN
+        touched = np.zeros_like(is_hidden)
+        for i, j in itertools.product(range(1, size-1), repeat=2):
+            around = (slice(None), slice(i-1, i+2), slice(j-1, j+2))
+            is_digit = windows[:, i, j] < cls.HIDDEN
+            constrains = is_digit & is_hidden[around].any(axis=(1, 2))
+            windows[is_digit & ~constrains, i, j] = cls.OTHER
+            touched[around] |= constrains[:, None, None]
+        windows[is_hidden & ~touched] = cls.OTHER
+        return windows
+
+    @staticmethod
+    def _symmetries():
+        """Returns an array with a row for each symmetry of the window square,
+        holding the flat window positions in the order they take under it."""
+        size = 2*PATTERN_RADIUS + 1
+        positions = np.arange(size*size).reshape(size, size)
+        return np.array([np.rot90(flipped, k).ravel()
+                         for flipped in (positions, positions[:, ::-1])
+                         for k in range(4)])
+
+    @classmethod
+    def canonical(cls, windows):
+        """Returns a pair (KEYS, POSITIONS) for the array of (windows). KEYS[n]
+        is the bytes of the form of window n which is the smallest under the
+        symmetries of the square, and POSITIONS[n][i] is the flat position in
+        window n of box i of KEYS[n]."""
+        symmetries = cls._symmetries()
+        count, area = len(windows), symmetries.shape[1]
+        forms = np.ascontiguousarray(windows.reshape(count, area)[:, symmetries])
+        # Byte strings of equal length compare like the windows should
+        best = forms.view(f'S{area}').reshape(count, len(symmetries)).argmin(axis=1)
+        keys = [form.tobytes() for form in forms[np.arange(count), best]]
+        return keys, symmetries[best].tolist()
+
+    @classmethod
+    def solve(cls, key):
+        """Solves the window with bytes (key) exhaustively. Returns a pair
+        (MINES, SAFE) of bitmasks over its boxes."""
+        size = 2*PATTERN_RADIUS + 1
+        window = np.frombuffer(key, dtype=np.uint8).reshape(size, size)
+        hidden = [i for i in range(window.size) if window.flat[i] == cls.HIDDEN]
+        index = {position: i for i, position in enumerate(hidden)}
+        constraints = []
+        for row, col in itertools.product(range(1, size-1), repeat=2):
+            if window[row, col] < cls.HIDDEN:
+                cells = tuple(index[nrow*size + ncol]
+                              for nrow in range(row-1, row+2)
+                              for ncol in range(col-1, col+2)
+                              if nrow*size + ncol in index)
+                constraints.append((cells, int(window[row, col])))
+        component = Component(tuple(hidden), tuple(constraints))
+        mine_counts, total = table_counts(solve_component(component, len(hidden)),
+                                          len(hidden))
+        mine_mask = safe_mask = 0
+        if total:
+            for position, mine_count in zip(hidden, mine_counts):
+                if mine_count == total:
+                    mine_mask |= 1 << position
+                elif mine_count == 0:
+                    safe_mask |= 1 << position
+        return mine_mask, safe_mask
+
+def load_patterns(path=PATTERNS_FILE):
+    """Returns the table of local patterns in the file at (path) (see
+    PatternEngine). The tables are loaded once and shared, so they should
+    not be changed."""
+    if path not in _pattern_tables:
+        with np.load(path) as data:
+            keys, mines, safe = data['keys'], data['mines'], data['safe']
+        _pattern_tables[path] = {key.tobytes(): (int(mine_mask), int(safe_mask))
+                                 for key, mine_mask, safe_mask in zip(keys, mines, safe)}
+    return _pattern_tables[path]
+
+def save_patterns(table, path=PATTERNS_FILE):
+    """Saves the entries of (table) which force something to the file at
+    (path), compressed, as arrays of the window bytes and the two masks."""
+    entries = sorted((key, masks) for key, masks in table.items() if any(masks))
+    size = (2*PATTERN_RADIUS + 1) ** 2
+    keys = np.frombuffer(b''.join(key for key, _ in entries), dtype=np.uint8)
+    np.savez_compressed(path, keys=keys.reshape(-1, size),
+                        mines=np.array([masks[0] for _, masks in entries], dtype=np.uint32),
+                        safe=np.array([masks[1] for _, masks in entries], dtype=np.uint32))
 
-class BruteForceEngine(Engine):
-    def __init__(self, board, risky=False):
+def make_patterns(nrows, ncols, mines, ngames, seed=0, path=PATTERNS_FILE):
+    """Builds the table of (PatternEngine) from the windows met in (ngames)
+    simulated games, played by a learning (PatternEngine) followed by the
+    "probability_risky" engine, and saves it to (path). The table already at
+    (path), if any, is extended, so tables for several board dimensions can
+    be built one after the other."""
+    table = dict(load_patterns(path)) if os.path.exists(path) else {}
+    for i in range(ngames):
+        board = Board.blank(nrows, ncols, mines)
+        game = Game(nrows, ncols, mines, seed + i)
+        engine = SequenceEngine([PatternEngine(board, table, learn=True),
+                                 make_engine("probability_risky", board)], verbose=False)
+        SimulatedAgent(board, engine, game).play_full()
+    save_patterns(table, path)
+    print(f'[make_patterns] windows: {len(table)}, '
+          f'forcing: {sum(1 for masks in table.values() if any(masks))}')
+
+# The number of solved components an engine remembers across moves
+DEFAULT_CACHE_SIZE = 256
+# The number of solutions sampled from each component which could not be
+# solved in time (see sample_component)
+DEFAULT_SAMPLES = 64
+# The share of the time left to a risky engine which is kept for sampling the
+# components it could not solve (see solving_deadline)
+SAMPLING_SHARE = 0.25
+
+def solving_deadline(deadline, risky, samples):
+    """Returns the (time.time) by which an engine with the (deadline) should
+    stop solving. If it is (risky) and takes (samples), SAMPLING_SHARE of the
+    time left is kept for sampled_guesses."""
+    if deadline is None or not (risky and samples > 0):
+        return deadline
+    now = time.time()
+    return now + max(0.0, deadline - now) * (1 - SAMPLING_SHARE)
+
+class ComponentEngine(Engine):
+    """The base of the engines which solve the frontier components on their
+    own (see solve_components), and mark the boxes which are the same in all
+    of their solutions. (BruteForceEngine) solves its equivalence classes
+    on the board instead."""
+
+    def __init__(self, board, risky=False, workers=1, cache_size=DEFAULT_CACHE_SIZE,
+                 samples=DEFAULT_SAMPLES):
+        """With more than one of (workers), the components are solved in
+        parallel. The tables of the last (cache_size) components are
+        remembered across runs. The components which are not solved before
+        the deadline are skipped, and when guessing, a box of each is picked
+        from (samples) sampled solutions (see sampled_guesses)."""
         self.board = board
         self.risky = risky
-        
-    def run(self):
+        self.workers = workers
+        self.cache = LRUCache(cache_size)
+        self.samples = samples
+        self.random = random.Random(0)
+
+    def solve(self, deadline=None):
+        """Returns a pair (COMPONENTS, TABLES) with the frontier components and
+        their tables, or None for the ones not solved by (deadline)."""
+        components = frontier_components(self.board)
+        hits = self.cache.hits
+        tables = solve_components(components, self.board.remaining,
+                                  self.workers, self.cache, deadline)
+        totals = [None if table is None else sum(count for count, _ in table.values())
+                  for table in tables]
+        self.stats = component_stats(components, totals, self.cache.hits - hits)
+        return components, tables
+
+    def marks(self, components, tables):
+        """Returns a pair (MINES, SAFE) with the boxes of (components) which
+        contain a mine in all or in none of the solutions in (tables), leaving
+        out the components without solutions. If (risky) is true and there are
+        none, SAFE has instead the least probable box of each component, or a
+        sampled guess if it was not solved."""
         mines, safe = set(), set()
         least_probables = set()
-        for equiv_class in self._equiv_classes():
-            possibilities = self._equiv_class_possibilities(equiv_class)
-            all_hidden = set(itertools.chain.from_iterable(
-                self.board.hidden_neighbors(rowcol) for rowcol in equiv_class))
-            mine_counts = {rowcol:0 for rowcol in all_hidden}
-            for posib in possibilities:
-                for rowcol in posib["mines"]:
-                    mine_counts[rowcol] += 1
-                if (7,11) in posib["safe"]:
-                    self.board_image_if(posib)
-                    exit()
-            mine_in_all, safe_in_all = set(), set()
-            least_counted, least_count = None, None
-            for rowcol, mine_count in mine_counts.items():
-                if least_counted is None or mine_count < least_count:
-                    least_counted, least_count = rowcol, mine_count
+        unsolved = []
+        for component, table in zip(components, tables):
+            if table is None:
+                unsolved.append(component)
+                continue
+            mine_counts, total = table_counts(table, len(component.rowcols))
+            if not total:
+                # No solutions, e.g. from a misread digit: nothing follows
+                continue
+            for rowcol, mine_count in zip(component.rowcols, mine_counts):
                 if mine_count == 0:
-                    safe_in_all.add(rowcol)
-                elif mine_count == len(possibilities):
-                    mine_in_all.add(rowcol)
-            least_probables.add(least_counted)
-            mines.update(mine_in_all)
-            safe.update(safe_in_all)
-        if self.risky and not (mines or safe):
-            safe = least_probables
+                    safe.add(rowcol)
+                elif mine_count == total:
+                    mines.add(rowcol)
+            least = min(range(len(mine_counts)), key=mine_counts.__getitem__)
+            least_probables.add(component.rowcols[least])
+        self.guessed = self.risky and not (mines or safe)
+        if self.guessed:
+            safe = least_probables | sampled_guesses(
+                unsolved, self.board.remaining, self.samples, self.random, self.deadline)
+        return mines, safe
+
+    def mark(self, mines, safe):
+        """Marks (mines) and (safe) in the board and returns them."""
         for rowcol in mines:
             self.board.mark_mine(rowcol)
         for rowcol in safe:
             self.board.mark_safe(rowcol)
         return mines, safe
 
+class BruteForceEngine(ComponentEngine):
+    """Finds the boxes which contain a mine in all or in none of the ways of
+    satisfying the D-boxes, by trying them all out on the board. The D-boxes
+    are split into equivalence classes, whose members are connected through
+    common hidden neighbors, and the choices of mines around the D-boxes of
+    a class are applied to the board one after the other (see _enumerate).
+
+    With more than one of (workers), the classes are enumerated in a pool of
+    that many processes, each on a copy of the board (see equiv_class_table),
+    so the search is the same whatever the number of workers. The rest, from
+    the cache to the guesses, is as in (ComponentEngine), with a class
+    standing for a component."""
+
+    def run(self):
+        components, tables = self.solve(
+            solving_deadline(self.deadline, self.risky, self.samples))
+        return self.mark(*self.marks(components, tables))
+
+    def solve(self, deadline=None):
+        """Returns a pair (COMPONENTS, TABLES), where COMPONENTS has the
+        (Component) of each equivalence class and TABLES its table, as
+        returned by (_equiv_class_table), or None if it could not be
+        enumerated before (deadline). The classes are looked up in the cache
+        by their components first, and the rest are enumerated from the
+        smallest up. With more than one worker, the classes with at least
+        PARALLEL_MIN_CELLS boxes are enumerated in the process pool
+        meanwhile, like the components of (solve_components)."""
+        equiv_classes = self._equiv_classes()
+        residuals = self.board.residuals().tolist()
+        components = [make_component(self.board, equiv_class, residuals)
+                      for equiv_class in equiv_classes]
+        keys = [component_key(component, self.board.remaining) for component in components]
+        tables = [self.cache.get(key) for key in keys]
+        missing = [i for i, table in enumerate(tables) if table is None]
+        futures = {}
+        if self.workers > 1:
+            pool = process_pool(self.workers)
+            futures = {i: pool.submit(equiv_class_table, self.board._codes, self.board.total,
+                                      equiv_classes[i], deadline)
+                       for i in missing if len(components[i].rowcols) >= PARALLEL_MIN_CELLS}
+        for i in sorted(missing, key=lambda i: len(components[i].rowcols)):
+            if i in futures:
+                continue
+            if deadline is not None and time.time() > deadline:
+                break
+            try:
+                tables[i] = self._equiv_class_table(equiv_classes[i], deadline)
+            except Timeout:
+                pass
+        for i, future in futures.items():
+            try:
+                tables[i] = future.result()
+            except Timeout:
+                pass
+        for i in missing:
+            if tables[i] is not None:
+                self.cache.put(keys[i], tables[i])
+        totals = [None if table is None else sum(count for count, _ in table.values())
+                  for table in tables]
+        self.stats = component_stats(components, totals, len(equiv_classes) - len(missing))
+        return components, tables
+
+    def _equiv_class_table(self, equiv_class, deadline=None):
+        """Counts the possibilities of (equiv_class) as they are enumerated,
+        without keeping them around. Returns a table like (solve_component)
+        does, with the hidden neighbors of the class in sorted order as the
+        boxes: a dict which maps a number of mines K to a pair (COUNT,
+        MINE_COUNTS), where COUNT is the number of possibilities with K mines
+        and MINE_COUNTS[i] is the number of those in which box i contains a
+        mine. Raises (Timeout) once (time.time) is past (deadline)."""
+        rowcols = sorted(set(itertools.chain.from_iterable(
+            self.board.hidden_neighbors(rowcol) for rowcol in equiv_class)))
+        position = {rowcol: i for i, rowcol in enumerate(rowcols)}
+        table = {}
+        for stack in self._enumerate(equiv_class, deadline):
+            cells = [position[rowcol]
+                     for choices, index in stack for rowcol in choices[index]["mines"]]
+            entry = table.get(len(cells))
+            if entry is None:
+                entry = table[len(cells)] = [0, [0] * len(rowcols)]
+            entry[0] += 1
+            mine_counts = entry[1]
+            for cell in cells:
+                mine_counts[cell] += 1
+        return {k: tuple(entry) for k, entry in table.items()}
+
     def _equiv_class_possibilities(self, equiv_class):
-        self._equiv_class = list(equiv_class)
         possibilities = []
+        for stack in self._enumerate(equiv_class):
+            possibility = {"mines": set(), "safe": set()}
+            for choices, index in stack:
+                choice = choices[index]
+                possibility["mines"].update(choice["mines"])
+                possibility["safe"].update(choice["safe"])
+            possibilities.append(possibility)
+        return possibilities
+
+    def _enumerate(self, equiv_class, deadline=None):
+        """Generates the possibilities of (equiv_class). Each one is yielded as
+        the stack of [CHOICES, INDEX] pairs, one per D-box, where CHOICES[INDEX]
+        is the choice for that D-box. The stack is reused, so it is only valid
+        until the next possibility is generated. Raises (Timeout) once
+        (time.time) is past (deadline), after undoing the choices applied to
+        the board."""
+        self._equiv_class = list(equiv_class)
         choices = self._dbox_choices(self._equiv_class[0])
         if choices is None:
             raise ValueError("No choices for first member of equivalence class")
         self._stack = [[choices, 0]]
+        steps = 0
         while self._stack:
+            steps += 1
+            if (deadline is not None and not steps % DEADLINE_CHECK_STEPS
+                    and time.time() > deadline):
+                # All choices but the last one are applied at this point
+                for choices, index in reversed(self._stack[:-1]):
+                    self._undo_choice(choices[index])
+                self._stack = []
+                raise Timeout
             if self._go_down():
-                possibility = {"mines": set(), "safe": set()}
-                for choices, index in self._stack:
-                    choice = choices[index]
-                    possibility["mines"].update(choice["mines"])
-                    possibility["safe"].update(choice["safe"])
-                possibilities.append(possibility)
+                yield self._stack
             self._backtrack()
-        return possibilities
 
     def _go_down(self):
         choices, choice_index = self._stack[-1]
@@ -469,10 +1581,8 @@ class BruteForceEngine(Engine):
         # which maps a node (representing a D-box) to the set of D-boxes with
         # which it has a common hidden neighbor.
         graph = {}
-        for digit in self.board.digit_rowcols:
+        for digit in self.board.frontier_rowcols:
             hidden_neighbors = self.board.hidden_neighbors(digit)
-            if not hidden_neighbors:
-                continue
             adj_set = graph[digit] = set()
             for hidden in hidden_neighbors:
                 adj_set.update(rowcol for rowcol in self.board.digit_neighbors(hidden)
@@ -503,41 +1613,910 @@ class BruteForceEngine(Engine):
         # [2023-02-01 Wed] Was useful for debugging purposes on, I'll keep just
         # in case. I wonder if it's also going to be useful in the future, if it
         # is, take a note.
-        board = self.board
-        img = board.last_update_img.copy()
-        draw = ImageDraw.Draw(img)
-        for rowcol in posib["mines"]:
-            b = board.boundaries[rowcol]
-            draw.rectangle((b.minx, b.miny, b.maxx, b.maxy), (0,0,0))
-        for rowcol in posib["safe"]:
-            b = board.boundaries[rowcol]
-            draw.rectangle((b.minx, b.miny, b.maxx, b.maxy), (0,38,255))
+        img = self.board.annotate(posib["mines"], posib["safe"])
         img.save("board_image_if.png", "PNG")
+
+def equiv_class_table(codes, N, equiv_class, deadline=None):
+    """Returns what (BruteForceEngine._equiv_class_table) does for
+    (equiv_class) on a board of (N) mines with the (codes) (see
+    Board.from_codes). This is how the classes are enumerated in the process
+    pool, where the board has to be made anew."""
+    engine = BruteForceEngine(Board.from_codes(codes, N))
+    return engine._equiv_class_table(equiv_class, deadline)
     
+# A connected component of the frontier, described without reference to the
+# board so that it is compact and picklable. (rowcols) are the hidden boxes
+# of the component, and (constraints) is a tuple of pairs (CELLS, MINES),
+# one per D-box, where CELLS is a tuple of indexes into (rowcols) and MINES
+# is how many of those contain a mine.
+Component = namedtuple('Component', 'rowcols constraints')
+
+def frontier_components(board):
+    """Returns the connected components of the frontier of (board) as a list
+    of (Component)s. Two hidden boxes are connected when they are neighbors
+    of the same D-box. The components and their boxes are sorted, so the
+    result only depends on the state of the board."""
+    digits = sorted(board.frontier_rowcols)
+    hidden = {digit: board.hidden_neighbors(digit) for digit in digits}
+    # ════════════════════════════════════════
+    # Union-find over the hidden boxes
+    parent = {}
+    def find(rowcol):
+        while parent[rowcol] != rowcol:
+            parent[rowcol] = parent[parent[rowcol]]
+            rowcol = parent[rowcol]
+        return rowcol
+    for digit in digits:
+        first, *rest = hidden[digit]
+        parent.setdefault(first, first)
+        for rowcol in rest:
+            parent.setdefault(rowcol, rowcol)
+            parent[find(rowcol)] = find(first)
+    # ════════════════════════════════════════
+    # Group the D-boxes by their roots
+    component_digits = defaultdict(list)
+    for digit in digits:
+        component_digits[find(next(iter(hidden[digit])))].append(digit)
+    residuals = board.residuals().tolist()
+    components = [make_component(board, digits, residuals)
+                  for digits in component_digits.values()]
+    components.sort(key=lambda component: component.rowcols[0])
+    return components
+
+def make_component(board, digits, residuals=None):
+    """Returns the (Component) made of the D-boxes at (digits) in (board). It
+    only depends on their hidden neighbors and how many mines are left among
+    them, not on where the D-boxes are. (residuals) is (board.residuals()) as
+    nested lists, which is computed if not given."""
+    if residuals is None:
+        residuals = board.residuals().tolist()
+    digits = sorted(digits)
+    hidden = {digit: board.hidden_neighbors(digit) for digit in digits}
+    rowcols = sorted(set().union(*hidden.values()))
+    position = {rowcol: i for i, rowcol in enumerate(rowcols)}
+    constraints = tuple(
+        (tuple(sorted(position[rowcol] for rowcol in hidden[digit])),
+         residuals[digit[0]][digit[1]])
+        for digit in digits)
+    return Component(tuple(rowcols), constraints)
+
+def component_key(component, max_mines):
+    """Returns a key under which the solutions of (component) with at most
+    (max_mines) mines can be cached. The limit is only part of the key when
+    it can matter, i.e. when it is below the number of boxes."""
+    return component, min(max_mines, len(component.rowcols))
+
+class LRUCache:
+    """A mapping which holds at most (size) entries, evicting the least
+    recently used one when it is full. A (size) of zero disables it."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        """Returns the value at (key), or None if there is none."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+def _solutions(component, max_mines, deadline=None, rng=None):
+    """Generates the solutions of (component): the ways of placing mines in
+    its boxes which satisfy all of its constraints, with at most (max_mines)
+    mines in total. Each one is yielded as a pair (MINES, VALUE), where MINES
+    is its number of mines and VALUE[i] is 1 if box i has a mine and 0
+    otherwise. VALUE is reused, so it is only valid until the next solution
+    is generated.
+
+    The search assigns boxes one at a time, starting from the constraint
+    with the fewest unassigned boxes. After every assignment, constraints
+    which have no mines left, or as many mines left as unassigned boxes,
+    force the rest of their boxes. Every constraint keeps counters of its
+    remaining mines and unassigned boxes, and the assignments are recorded
+    on a trail so that backtracking just unwinds them.
+
+    Raises (Timeout) once (time.time) is past (deadline). If (rng) is a
+    (random.Random), each decision tries the two values in a random order
+    instead of the safe one first."""
+    ncells = len(component.rowcols)
+    cells_of = [cells for cells, _ in component.constraints]
+    need = [mines for _, mines in component.constraints]
+    free = [len(cells) for cells in cells_of]
+    constraints_of = [[] for _ in range(ncells)]
+    for c, cells in enumerate(cells_of):
+        for cell in cells:
+            constraints_of[cell].append(c)
+    value = [-1] * ncells
+    trail = []
+    mines = 0
+
+    def assign(cell, val):
+        """Assigns (val) to (cell) and returns whether that is consistent."""
+        nonlocal mines
+        value[cell] = val
+        trail.append(cell)
+        mines += val
+        ok = mines <= max_mines
+        for c in constraints_of[cell]:
+            free[c] -= 1
+            need[c] -= val
+            if need[c] < 0 or need[c] > free[c]:
+                ok = False
+        return ok
+
+    def undo(length):
+        """Unwinds the trail back to (length) assignments."""
+        nonlocal mines
+        while len(trail) > length:
+            cell = trail.pop()
+            val = value[cell]
+            value[cell] = -1
+            mines -= val
+            for c in constraints_of[cell]:
+                free[c] += 1
+                need[c] += val
+
+    def propagate(queue):
+        """Forces the boxes of the constraints in (queue), and of those they
+        affect in turn. Returns whether everything is consistent."""
+        while queue:
+            c = queue.pop()
+            if not free[c] or 0 < need[c] < free[c]:
+                continue
+            val = 1 if need[c] else 0
+            for cell in cells_of[c]:
+                if value[cell] == -1:
+                    if not assign(cell, val):
+                        return False
+                    queue.extend(constraints_of[cell])
+        return True
+
+    def choose():
+        """Returns an unassigned box of the most constrained constraint, or
+        None if all boxes are assigned."""
+        best = None
+        for c in range(len(cells_of)):
+            if free[c] and (best is None or free[c] < free[best]):
+                best = c
+                if free[c] == 1:
+                    break
+        if best is None:
+            return None
+        return next(cell for cell in cells_of[best] if value[cell] == -1)
+
+    def try_value(cell, val):
+        return assign(cell, val) and propagate(list(constraints_of[cell]))
+
+    if not propagate(list(range(len(cells_of)))):
+        return
+    frames = [] # [TRAIL_LENGTH, CELL, VALUE, FIRST VALUE] for every decision
+    steps = 0
+    while True:
+        steps += 1
+        if (deadline is not None and not steps % DEADLINE_CHECK_STEPS
+                and time.time() > deadline):
+            raise Timeout
+        cell = choose()
+        if cell is None:
+            yield mines, value
+            ok = False
+        else:
+            first = rng.randrange(2) if rng is not None else 0
+            frames.append([len(trail), cell, first, first])
+            ok = try_value(cell, first)
+        while not ok:
+            if not frames:
+                return
+            frame = frames[-1]
+            undo(frame[0])
+            if frame[2] == frame[3]:
+                frame[2] = 1 - frame[3]
+                ok = try_value(frame[1], frame[2])
+            else:
+                frames.pop()
+
+def solve_component(component, max_mines, deadline=None):
+    """Enumerates the solutions of (component) with at most (max_mines) mines
+    (see _solutions). Returns a dict which maps a number of mines K to a pair
+    (COUNT, MINE_COUNTS), where COUNT is the number of solutions with K mines
+    and MINE_COUNTS[i] is the number of those in which box i has a mine.
+    Raises (Timeout) once (time.time) is past (deadline), which may be before
+    it starts."""
+    if deadline is not None and time.time() > deadline:
+        raise Timeout
+    ncells = len(component.rowcols)
+    table = {}
+    for mines, value in _solutions(component, max_mines, deadline):
+        entry = table.get(mines)
+        if entry is None:
+            entry = table[mines] = [0, [0] * ncells]
+        entry[0] += 1
+        mine_counts = entry[1]
+        for i, val in enumerate(value):
+            mine_counts[i] += val
+    return {k: tuple(entry) for k, entry in table.items()}
+
+def sample_component(component, max_mines, nsamples, rng, deadline=None):
+    """Samples up to (nsamples) solutions of (component), for components too
+    big to be solved in time, each the first one found by a search whose
+    decisions are made at random (see _solutions). Returns a list with the
+    fraction of the samples in which each box has a mine, or None if the
+    component has no solutions or none was sampled before (deadline).
+
+    The search finds some solutions much more often than others, and the
+    samples are not weighted by how many ways the rest of the board can be
+    completed, so the fractions are mine frequencies among the samples, not
+    probabilities. They are only good enough to pick a guess."""
+    mine_counts = [0] * len(component.rowcols)
+    taken = 0
+    for _ in range(nsamples):
+        if deadline is not None and time.time() > deadline:
+            break
+        try:
+            solution = next(_solutions(component, max_mines, deadline, rng), None)
+        except Timeout:
+            break
+        if solution is None:
+            return None
+        taken += 1
+        for i, val in enumerate(solution[1]):
+            mine_counts[i] += val
+    if not taken:
+        return None
+    return [Fraction(count, taken) for count in mine_counts]
+
+def table_counts(table, ncells):
+    """Sums up a table returned by (solve_component) for a component with
+    (ncells) boxes. Returns a pair (MINE_COUNTS, TOTAL), where TOTAL is the
+    number of solutions and MINE_COUNTS[i] is the number of those in which
+    box i has a mine."""
+    total = sum(count for count, _ in table.values())
+    mine_counts = [sum(counts) for counts in zip(*(counts for _, counts in table.values()))]
+    return mine_counts or [0] * ncells, total
+
+# Components with fewer boxes than this are not worth sending to another
+# process, they are solved in place (see solve_components).
+PARALLEL_MIN_CELLS = 16
+# Maps a number of workers to the process pool with that many processes.
+_process_pools = {}
+
+def process_pool(workers):
+    """Returns a pool of (workers) processes. The pools are shared and live
+    until the program exits."""
+    if workers not in _process_pools:
+        _process_pools[workers] = concurrent.futures.ProcessPoolExecutor(workers)
+    return _process_pools[workers]
+
+def solve_components(components, max_mines, workers=1, cache=None, deadline=None):
+    """Returns the list of the tables which (solve_component) returns for
+    (components), in the same order. With more than one of (workers), the
+    components with at least PARALLEL_MIN_CELLS boxes are solved in a process
+    pool while the smaller ones are solved in place. Components are
+    independent, and only their compact descriptions travel between
+    processes, so the result does not depend on the number of workers.
+
+    If (cache) is an (LRUCache), the tables are looked up in it first, and
+    the ones which had to be solved are stored there (see component_key).
+
+    The components which are not solved by (deadline) get None instead of a
+    table. The ones solved in place are solved from the smallest up, so that
+    as many as possible are done in time."""
+    keys = [component_key(component, max_mines) for component in components]
+    tables = [None if cache is None else cache.get(key) for key in keys]
+    missing = [i for i, table in enumerate(tables) if table is None]
+    futures = {}
+    if workers > 1:
+        pool = process_pool(workers)
+        futures = {i: pool.submit(solve_component, components[i], max_mines, deadline)
+                   for i in missing if len(components[i].rowcols) >= PARALLEL_MIN_CELLS}
+    for i in sorted(missing, key=lambda i: len(components[i].rowcols)):
+        if i not in futures:
+            try:
+                tables[i] = solve_component(components[i], max_mines, deadline)
+            except Timeout:
+                pass
+    for i, future in futures.items():
+        try:
+            tables[i] = future.result()
+        except Timeout:
+            pass
+    if cache is not None:
+        for i in missing:
+            if tables[i] is not None:
+                cache.put(keys[i], tables[i])
+    return tables
+
+def component_stats(components, totals, cached):
+    """Returns the (Engine.stats) of a run which solved (components), where
+    (totals) has the number of solutions of each, or None if it was not
+    solved in time, and (cached) is how many were found in the cache."""
+    return {'components': len(components),
+            'sizes': [len(component.rowcols) for component in components],
+            'configurations': sum(total for total in totals if total is not None),
+            'cached': cached,
+            'timeouts': sum(total is None for total in totals)}
+
+def sampled_guesses(components, max_mines, nsamples, rng, deadline=None):
+    """Returns a set with the box of each of (components) which has a mine in
+    the fewest of (nsamples) sampled solutions (see sample_component). The
+    components are sampled from the smallest up, and the ones not reached by
+    (deadline) get no box. Returns an empty set if (nsamples) is zero."""
+    result = set()
+    if nsamples <= 0:
+        return result
+    for component in sorted(components, key=lambda component: len(component.rowcols)):
+        if deadline is not None and time.time() > deadline:
+            break
+        frequencies = sample_component(component, max_mines, nsamples, rng, deadline)
+        if frequencies is not None:
+            least = min(range(len(frequencies)), key=frequencies.__getitem__)
+            result.add(component.rowcols[least])
+    return result
+
+class SolverEngine(ComponentEngine):
+    """Finds the same mines and safe boxes as (BruteForceEngine), but searches
+    over the hidden boxes of each frontier component with (solve_component),
+    without marking the board until the search is over. With more than one of
+    (workers), the components are solved in parallel (see solve_components)."""
+
+    def run(self):
+        components, tables = self.solve(
+            solving_deadline(self.deadline, self.risky, self.samples))
+        return self.mark(*self.marks(components, tables))
+
+def _comb(n, k):
+    """Like (math.comb), but zero when (k) is out of range."""
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+def _convolve(a, b):
+    """Returns the convolution of the dicts (a) and (b), which map mine counts
+    to numbers of solutions."""
+    result = defaultdict(int)
+    for i, x in a.items():
+        for j, y in b.items():
+            result[i+j] += x * y
+    return dict(result)
+
+class ProbabilityEngine(ComponentEngine):
+    """Computes the exact probability that each hidden box contains a mine,
+    given the digits and the number of remaining mines, and uses them to
+    find the mines and safe boxes. If (risky) is true and none are found, the
+    box with the smallest probability is taken to be safe.
+
+    Each frontier component is solved on its own (see solve_component) and
+    summarized as a table from its number of mines to its number of
+    solutions. The components are then combined by convolving their tables,
+    and the hidden boxes outside of the frontier are accounted for with
+    binomial weights: with U such boxes and R remaining mines, a combination
+    of solutions with K mines in total can be completed in comb(U, R-K)
+    ways. The joint configurations of the components are never enumerated.
+
+    If some components are not solved before the deadline, the probabilities
+    cannot be computed, and the engine falls back to what (SolverEngine)
+    would find with the components which were solved."""
+
+    def run(self):
+        components, tables = self.solve(
+            solving_deadline(self.deadline, self.risky, self.samples))
+        if any(table is None for table in tables):
+            return self.mark(*self.marks(components, tables))
+        probabilities = self._probabilities(components, tables)
+        mines = set(rowcol for rowcol, p in probabilities.items() if p == 1)
+        safe = set(rowcol for rowcol, p in probabilities.items() if p == 0)
+        self.guessed = self.risky and not (mines or safe) and bool(probabilities)
+        if self.guessed:
+            safe = {min(probabilities, key=lambda rowcol: (probabilities[rowcol], rowcol))}
+        return self.mark(mines, safe)
+
+    def probabilities(self):
+        """Returns a dict which maps every hidden rowcol to the probability, as
+        a (Fraction), that it contains a mine. The dict is empty if the board
+        is inconsistent."""
+        return self._probabilities(*self.solve())
+
+    def _probabilities(self, components, tables):
+        """Like (probabilities), given the frontier (components) and all their
+        (tables)."""
+        board = self.board
+        remaining = board.remaining
+        frontier = set(itertools.chain.from_iterable(c.rowcols for c in components))
+        others = sorted(board.hidden_rowcols - frontier)
+        # ════════════════════════════════════════
+        # prefixes[i] is the convolution of the first i tables, suffixes[i]
+        # is that of the tables from i on.
+        counts = [{k: count for k, (count, _) in table.items()} for table in tables]
+        prefixes, suffixes = [{0: 1}], [{0: 1}]
+        for dist in counts:
+            prefixes.append(_convolve(prefixes[-1], dist))
+        for dist in reversed(counts):
+            suffixes.append(_convolve(suffixes[-1], dist))
+        suffixes.reverse()
+        weight = sum(count * _comb(len(others), remaining - k)
+                     for k, count in prefixes[-1].items())
+        if not weight:
+            return {}
+        # ════════════════════════════════════════
+        probabilities = {}
+        for i, (component, table) in enumerate(zip(components, tables)):
+            rest = _convolve(prefixes[i], suffixes[i+1])
+            mine_weights = [0] * len(component.rowcols)
+            for k, (_, mine_counts) in table.items():
+                # the number of ways to complete a solution with K mines
+                completions = sum(count * _comb(len(others), remaining - k - j)
+                                  for j, count in rest.items())
+                for cell, mine_count in enumerate(mine_counts):
+                    mine_weights[cell] += mine_count * completions
+            for rowcol, mine_weight in zip(component.rowcols, mine_weights):
+                probabilities[rowcol] = Fraction(mine_weight, weight)
+        if others:
+            other_weight = sum(count * _comb(len(others) - 1, remaining - k - 1)
+                               for k, count in prefixes[-1].items())
+            other_probability = Fraction(other_weight, weight)
+            for rowcol in others:
+                probabilities[rowcol] = other_probability
+        return probabilities
+
 class SequenceEngine(Engine):
-    def __init__(self, engines):
+    """Runs (engines) in turn until one of them finds something. If (budget)
+    is not None, every run has that many seconds, after which the engines
+    return the best they have found so far (see Engine.deadline)."""
+
+    def __init__(self, engines, verbose=True, budget=None):
         self.engines = engines
+        self.verbose = verbose
+        self.budget = budget
+
     def run(self):
+        deadline = None if self.budget is None else time.time() + self.budget
+        self.stats = {'engines': []}
         for engine in self.engines:
-            print(f"[SequenceEngine] Running {type(engine).__name__}.")
+            if self.verbose:
+                print(f"[SequenceEngine] Running {type(engine).__name__}.")
+            engine.deadline = deadline
+            start = time.perf_counter()
             mines, safe = engine.run()
+            self.stats['engines'].append(engine_record(engine, time.perf_counter() - start,
+                                                       mines, safe))
+            self.guessed = engine.guessed
             if mines or safe:
+                # The other engines need to know about the marks
+                for other in self.engines:
+                    if other is not engine:
+                        other.notify(mines | safe)
                 return mines, safe
         return set(), set()
 
+    def notify(self, rowcols):
+        for engine in self.engines:
+            engine.notify(rowcols)
+
+# Profiling
+# ════════════════════════════════════════
+
+def engine_record(engine, elapsed, mines, safe):
+    """Returns the profile record of a run of (engine) which took (elapsed)
+    seconds and found (mines) and (safe), together with its (stats)."""
+    return {'name': type(engine).__name__, 'time': elapsed,
+            'mines': len(mines), 'safe': len(safe), **(engine.stats or {})}
+
+class Profiler:
+    """Records how long the phases of every move take: the screen captures,
+    the classification of the boxes, the engine runs and the clicks. Each
+    move is written as a JSON line to the file at (path), and (close) prints
+    a summary. Without a (path), nothing is recorded.
+
+    The time of a phase which runs within another phase is only counted as
+    its own, e.g. the sync at the end of (Agent.mark_and_reveal) is not part
+    of the actuation."""
+
+    PHASES = ('capture', 'classification', 'engine', 'actuation')
+
+    def __init__(self, path=None):
+        self.file = None if path is None else open(path, 'w')
+        # extra fields of every record, e.g. the game of a simulation
+        self.fields = {}
+        self.record = {}
+        self.moves = 0
+        self.totals = defaultdict(float)
+        # maps engine names to [RUNS, TIME, RUNS WHICH FOUND SOMETHING]
+        self.engines = defaultdict(lambda: [0, 0.0, 0])
+        # the time spent in the phases nested in each running phase
+        self._nested = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the code in the with block as the phase (name) of the
+        current move."""
+        if self.file is None:
+            yield
+            return
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.record[name] = self.record.get(name, 0.0) + elapsed - nested
+
+    def engine_run(self, engine, mines, safe):
+        """Records the run of (engine) in the current move, which found (mines)
+        and (safe). The engines of a (SequenceEngine) are recorded one by one."""
+        if self.file is None:
+            return
+        if isinstance(engine, SequenceEngine):
+            records = engine.stats['engines']
+        else:
+            records = [engine_record(engine, self.record.get('engine', 0.0), mines, safe)]
+        self.record['engines'] = records
+        for record in records:
+            totals = self.engines[record['name']]
+            totals[0] += 1
+            totals[1] += record['time']
+            totals[2] += bool(record['mines'] or record['safe'])
+
+    def end_move(self):
+        """Writes the record of the current move and starts the next one."""
+        if self.file is None or not self.record:
+            return
+        record = {**self.fields, 'move': self.moves,
+                  **{phase: self.record.get(phase, 0.0) for phase in self.PHASES},
+                  **self.record}
+        self.file.write(json.dumps(record) + '\n')
+        for phase in self.PHASES:
+            self.totals[phase] += record[phase]
+        self.moves += 1
+        self.record = {}
+
+    def close(self):
+        """Closes the file and prints the totals and the per move means of the
+        phases, and of the engine runs."""
+        if self.file is None:
+            return
+        self.end_move()
+        self.file.close()
+        print(f'[profile] moves: {self.moves}')
+        for phase in self.PHASES:
+            total = self.totals[phase]
+            print(f'[profile] {phase:>14}: {total:8.3f}s total, '
+                  f'{total / max(self.moves, 1) * 1000:8.3f}ms per move')
+        for name, (runs, total, found) in sorted(self.engines.items()):
+            print(f'[profile] {name:>20}: {runs} runs, {total:.3f}s total, '
+                  f'{total / runs * 1000:.3f}ms per run, found something in {found}')
+
+# Move logs
+# ════════════════════════════════════════
+
+class MoveLog:
+    """Appends the positions of games to a compact binary file at (path), one
+    per sync (see Agent.sync_board), so that engines can be benchmarked on
+    them later (see replay).
+
+    The file starts with MAGIC. Every position is a header with the number
+    of rows, the number of columns and the number of mines, as unsigned
+    16-bit integers, followed by the codes of the boxes row by row (see
+    Board.CODES), offset by CODE_OFFSET so that they fit in 4 bits and packed
+    two to a byte."""
+
+    MAGIC = b'MINESLOG1'
+    HEADER = struct.Struct('<HHH')
+    CODE_OFFSET = -Board.HIT_CODE
+
+    def __init__(self, path):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if new:
+            self.file.write(self.MAGIC)
+
+    def append(self, board):
+        codes = board._codes.ravel().astype(np.uint8) + self.CODE_OFFSET
+        if len(codes) % 2:
+            codes = np.append(codes, 0)
+        self.file.write(self.HEADER.pack(board.nrows, board.ncols, board.total))
+        self.file.write((codes[0::2] << 4 | codes[1::2]).astype(np.uint8).tobytes())
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_move_log(path):
+    """Generates the positions in the move log at (path) as (Board.blank)
+    boards (see MoveLog)."""
+    for codes, N in read_move_log_codes(path):
+        yield Board.from_codes(codes, N)
+
+def read_move_log_codes(path):
+    """Generates the positions in the move log at (path) as pairs (CODES, N),
+    unpacked straight from the file (see Board.CODES)."""
+    with open(path, 'rb') as file:
+        if file.read(len(MoveLog.MAGIC)) != MoveLog.MAGIC:
+            raise ValueError(f'Not a move log: {path}')
+        while True:
+            header = file.read(MoveLog.HEADER.size)
+            if not header:
+                return
+            nrows, ncols, N = MoveLog.HEADER.unpack(header)
+            packed = np.frombuffer(file.read((nrows*ncols + 1) // 2), dtype=np.uint8)
+            codes = np.empty(2 * len(packed), dtype=np.int8)
+            codes[0::2] = packed >> 4
+            codes[1::2] = packed & 0xf
+            codes -= MoveLog.CODE_OFFSET
+            yield codes[:nrows*ncols].reshape(nrows, ncols), N
+
+def replay(path, engine_name, **options):
+    """Runs the engine called (engine_name) on every position in the move log
+    at (path), and prints how long each run took and what it found, followed
+    by a summary. Each position gets a new engine, so what engines keep
+    across moves, like caches, does not carry over. (options) are passed on
+    to (make_engine)."""
+    times = []
+    found = 0
+    for i, board in enumerate(read_move_log(path)):
+        engine = make_engine(engine_name, board, verbose=False, **options)
+        start = time.perf_counter()
+        mines, safe = engine.run()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        found += bool(mines or safe)
+        print(f'[replay] {i:>5}: {board.nrows}x{board.ncols}, '
+              f'{len(board.hidden_rowcols):>4} hidden, {elapsed*1000:9.3f}ms, '
+              f'{len(mines)} mines, {len(safe)} safe')
+    if not times:
+        print('[replay] no positions')
+        return
+    print(f'[replay] positions: {len(times)}, found something in {found}')
+    print(f'[replay] total: {sum(times):.3f}s, '
+          f'per position: {sum(times)/len(times)*1000:.3f}ms, '
+          f'slowest: {max(times)*1000:.3f}ms')
+
+# Positions which a batch keeps in flight per worker process. Bounds the
+# memory taken by a corpus of any size (see batch).
+BATCH_IN_FLIGHT = 4
+
+def corpus_positions(path):
+    """Generates the positions of the corpus at (path), which is a move log,
+    a screenshot or a directory whose files are either, walked in name
+    order. Positions from move logs are pairs (CODES, N) (see Board.CODES),
+    and screenshots are generated as their paths, so that they are read
+    where they are solved."""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            yield from corpus_positions(os.path.join(path, name))
+        return
+    with open(path, 'rb') as file:
+        magic = file.read(len(MoveLog.MAGIC))
+    if magic == MoveLog.MAGIC:
+        yield from read_move_log_codes(path)
+    else:
+        yield path
+
+def solve_position(position, engine_name, screenshot, options):
+    """Runs the engine called (engine_name) on (position), as generated by
+    (corpus_positions). (screenshot) is a triple (TOPLEFT, (NROWS, NCOLS), N)
+    describing the boards in screenshots. Returns a dict with the results and
+    timings, read from the board when it is not (Board.blank). Screenshots
+    without a TOPLEFT are calibrated, without a cache (see read_board)."""
+    start = time.perf_counter()
+    if isinstance(position, str):
+        from PIL import Image
+        topleft, (nrows, ncols), N = screenshot
+        board = read_board(Image.open(position).convert('RGB'), topleft, nrows, ncols, N)
+        source = position
+    else:
+        board = Board.from_codes(*position)
+        source = None
+    read_time = time.perf_counter() - start
+    engine = make_engine(engine_name, board, verbose=False, **options)
+    start = time.perf_counter()
+    mines, safe = engine.run()
+    return {'source': source, 'nrows': board.nrows, 'ncols': board.ncols,
+            'hidden': len(board.hidden_rowcols), 'mines': len(mines), 'safe': len(safe),
+            'read': read_time, 'solve': time.perf_counter() - start}
+
+def batch(path, engine_name, workers=1, screenshot=None, output=None, **options):
+    """Runs the engine called (engine_name) on every position of the corpus
+    at (path) (see corpus_positions) in a pool of (workers) processes, and
+    prints the result of each position as it finishes, followed by a
+    summary. If (output) is given, the results are also written there as
+    JSON lines, each with the index of its position in the corpus. A
+    position which cannot be solved, e.g. a file in the corpus which is
+    neither a move log nor a screenshot of a board, gets a result with just
+    its index, its source and the error, and the run goes on.
+
+    Positions are read lazily and at most BATCH_IN_FLIGHT per worker are
+    pending at any time, so memory does not grow with the corpus. The
+    engines solve their components in place (the workers are the
+    parallelism), and (options) are passed on to (make_engine)."""
+    options = dict(options, workers=1)
+    positions = enumerate(corpus_positions(path))
+    pending = {}
+    times = []
+    found = errors = 0
+    out = open(output, 'w') if output else None
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            while True:
+                free = BATCH_IN_FLIGHT*workers - len(pending)
+                for i, position in itertools.islice(positions, free):
+                    future = pool.submit(solve_position, position, engine_name, screenshot,
+                                         options)
+                    pending[future] = i, position if isinstance(position, str) else None
+                if not pending:
+                    break
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    i, source = pending.pop(future)
+                    try:
+                        result = dict(index=i, **future.result())
+                    except Exception as error:
+                        result = {'index': i, 'source': source,
+                                  'error': f'{type(error).__name__}: {error}'}
+                        errors += 1
+                        print(f'[batch] {i:>5}: {source or "move log"}: {result["error"]}')
+                        if out:
+                            out.write(json.dumps(result) + '\n')
+                        continue
+                    times.append(result['solve'])
+                    found += bool(result['mines'] or result['safe'])
+                    print(f'[batch] {i:>5}: {result["nrows"]}x{result["ncols"]}, '
+                          f'{result["hidden"]:>4} hidden, {result["solve"]*1000:9.3f}ms, '
+                          f'{result["mines"]} mines, {result["safe"]} safe')
+                    if out:
+                        out.write(json.dumps(result) + '\n')
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f'[batch] errors: {errors}')
+    if not times:
+        print('[batch] no positions')
+        return
+    print(f'[batch] positions: {len(times)}, found something in {found}')
+    print(f'[batch] wall: {elapsed:.3f}s, '
+          f'{len(times)/elapsed:.1f} positions/s with {workers} workers')
+    print(f'[batch] solving: {sum(times):.3f}s, '
+          f'per position: {sum(times)/len(times)*1000:.3f}ms, '
+          f'slowest: {max(times)*1000:.3f}ms')
+
 # Agent
 # ════════════════════════════════════════
 
+# Paths through more boxes than this are not improved by (plan_path) after
+# the nearest neighbor tour, since 2-opt takes quadratic time per pass.
+TWO_OPT_MAX_BOXES = 200
+
+def plan_path(rowcols, start=None):
+    """Returns (rowcols) as a list in the order of a short cursor path from
+    (start), or from the top-left box of (rowcols) if (start) is None. The
+    path is first made by always going to the nearest box left, and then
+    improved with 2-opt, i.e. by reversing the parts of it whose reversal
+    makes it shorter, until none does."""
+    rowcols = sorted(rowcols)
+    if len(rowcols) < 2:
+        return rowcols
+    points = np.array(([start] if start is not None else []) + rowcols, dtype=float)
+    dist = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=2))
+    # ════════════════════════════════════════
+    # Nearest neighbor tour. Index 0 is the start and stays first.
+    path = [0]
+    left = np.ones(len(points), dtype=bool)
+    left[0] = False
+    for _ in range(len(points) - 1):
+        distances = np.where(left, dist[path[-1]], np.inf)
+        path.append(int(distances.argmin()))
+        left[path[-1]] = False
+    # ════════════════════════════════════════
+    # 2-opt on the open path. Python lists index faster than arrays.
+    dist = dist.tolist()
+    improved = len(path) <= TWO_OPT_MAX_BOXES
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                old = dist[path[i-1]][path[i]]
+                new = dist[path[i-1]][path[j]]
+                if j + 1 < len(path):
+                    old += dist[path[j]][path[j+1]]
+                    new += dist[path[i]][path[j+1]]
+                if new < old - 1e-9:
+                    path[i:j+1] = reversed(path[i:j+1])
+                    improved = True
+    offset = 1 if start is not None else 0
+    return [rowcols[i - offset] for i in path[offset:]]
+
+# Fewer boxes than this are opened one by one rather than with a chord
+CHORD_MIN_BOXES = 2
+
+def plan_chords(board, safe):
+    """Returns a pair (CHORDS, REST), where CHORDS is a set of D-boxes around
+    which all mines are marked in (board), so that clicking them opens all
+    of their other hidden neighbors at once, and REST is the set of the boxes
+    of (safe) which none of the chords opens. The chords are picked greedily,
+    the one opening the most boxes of (safe) first."""
+    rest = set(safe)
+    candidates = set()
+    for rowcol in rest:
+        candidates.update(board.digit_neighbors(rowcol))
+    opened = {}
+    for digit in candidates:
+        if len(board.mine_neighbors(digit)) == board[digit]:
+            opened[digit] = set(filter(board.is_unknown, board.neighbors(digit)))
+    chords = set()
+    while opened:
+        digit = max(sorted(opened), key=lambda digit: len(opened[digit] & rest))
+        if len(opened[digit] & rest) < CHORD_MIN_BOXES:
+            break
+        chords.add(digit)
+        rest -= opened.pop(digit)
+    return chords, rest
+
+# The thread switch interval while playing pipelined. The default of 5ms
+# would often keep the clicking thread waiting while the engine runs.
+PIPELINE_SWITCH_INTERVAL = 0.0005
+# How many of the latest clicks and syncs the pipelined agent averages to
+# tell how long the next ones will take
+PIPELINE_TIMING_WINDOW = 16
+
 class Agent:
-    def __init__(self, board, engine):
+    # The reasons for which (Agent.play_full) stops
+    HIT_MINE = 'a mine was hit'
+    STUCK = 'engine not good enough.'
+    DONE = 'no more mines.'
+
+    def __init__(self, board, engine, dirty=False, verbose=True, profiler=None, log=None):
+        """When (dirty) is true, syncing only reclassifies the boxes around
+        the ones revealed since the last sync (see Agent.sync_board). The
+        moves are timed with (profiler), and the synced positions appended to
+        the (MoveLog) (log), if given."""
         self.engine = engine
         self.board = board
+        self.dirty = dirty
+        self.verbose = verbose
+        self.profiler = profiler or Profiler()
+        self.log = log
+        # the number of batches of clicks planned
+        self.moves = 0
         # the rowcol at which the cursor is at
         self.rowcol = None
+        # the rowcols revealed since the last sync. In (play_pipelined), the
+        # clicker thread adds to them while the engine's thread takes them,
+        # so both go through (_revealed_lock).
+        self.revealed = set()
+        self._revealed_lock = threading.Lock()
+
+    def add_revealed(self, rowcols):
+        """Adds (rowcols) to the ones revealed since the last sync."""
+        with self._revealed_lock:
+            self.revealed.update(rowcols)
+
+    def take_revealed(self):
+        """Returns the rowcols revealed since the last sync, and starts over."""
+        with self._revealed_lock:
+            revealed, self.revealed = self.revealed, set()
+        return revealed
 
     def reveal(self, rowcol):
         self.moveTo(rowcol)
         pyautogui.click()
+        self.add_revealed([rowcol])
         
     def mark(self, rowcol):
         self.moveTo(rowcol)
@@ -545,6 +2524,20 @@ class Agent:
         pyautogui.click()
         pyautogui.keyUp('ctrl')
 
+    def mark_all(self, rowcols):
+        """Marks (rowcols) in order, holding ctrl throughout."""
+        pyautogui.keyDown('ctrl')
+        for rowcol in rowcols:
+            self.moveTo(rowcol)
+            pyautogui.click()
+        pyautogui.keyUp('ctrl')
+
+    def chord(self, rowcol):
+        """Clicks the D-box at (rowcol), which opens its hidden neighbors if
+        all of its mines are flagged."""
+        self.moveTo(rowcol)
+        pyautogui.click()
+
     def moveTo(self, rowcol):
         to_xy = self.board.getxy(rowcol)
         pyautogui.moveTo(to_xy)
@@ -552,8 +2545,45 @@ class Agent:
         
     def sync_board(self):
         """Synchronizes the state of (board) to that in the game. Returns the
-        rowcols which have new values."""
-        return self.board.update(pyautogui.screenshot())
+        rowcols which have new values, or None if a mine was hit. The engine is
+        notified about the new values, and the position is logged."""
+        changed = self._sync()
+        if changed:
+            self.engine.notify(changed)
+        if changed is not None and self.log is not None:
+            self.log.append(self.board)
+        return changed
+
+    def _sync(self):
+        """Updates (board) from the screen. Only the board's region of the
+        screen is captured. In dirty mode, only the boxes around the revealed
+        ones are captured and reclassified at first. If an EMPTY box turns up
+        among them, the game may have opened boxes anywhere through a cascade,
+        so the whole board is synced after all."""
+        board = self.board
+        revealed = self.take_revealed()
+        if not (self.dirty and revealed):
+            return self._sync_region()
+        rowcols = set(revealed)
+        for rowcol in revealed:
+            rowcols.update(board.neighbors(rowcol))
+        rowcols = set(filter(board.is_unknown, rowcols))
+        if not rowcols:
+            return []
+        changed = self._sync_region(rowcols)
+        if changed is None or not any(board[rowcol] is Board.EMPTY for rowcol in changed):
+            return changed
+        cascade = self._sync_region()
+        return None if cascade is None else changed + cascade
+
+    def _sync_region(self, rowcols=None):
+        """Captures the region of the screen containing (rowcols), or the whole
+        board, and updates those boxes from it."""
+        region = self.board.region(rowcols)
+        with self.profiler.phase('capture'):
+            img = pyautogui.screenshot(region=region)
+        with self.profiler.phase('classification'):
+            return self.board.update(img, region[:2], rowcols)
 
     def switch(self):
         pyautogui.keyDown('alt')
@@ -571,46 +2601,837 @@ class Agent:
         os.system(f"notify-send '{text}'")
 
     def mark_and_reveal(self, mines, safe):
-        pyautogui.keyDown('ctrl')
-        for rowcol in mines:
-            self.moveTo(rowcol)
-            pyautogui.click()
-        pyautogui.keyUp('ctrl')
-        for rowcol in safe:
-            self.reveal(rowcol)
+        self.click_all(*self.plan_clicks(mines, safe))
         self.sync_board()
+
+    def plan_clicks(self, mines, safe):
+        """Plans the clicks which mark (mines) and then open (safe), in the
+        order of short cursor paths (see plan_path). The boxes of (safe) around
+        a D-box whose mines are all marked by then are opened with a chord
+        (see plan_chords). Returns a pair (MINES, OPENS) for (click_all), where
+        MINES is a list of rowcols and OPENS a list of pairs (ROWCOL, CHORDED).
+        CHORDED is None if ROWCOL is opened itself, or else the list of the
+        boxes which the chord on ROWCOL opens, worked out while the board
+        still has them unknown."""
+        self.moves += 1
+        mines = plan_path(mines, self.rowcol)
+        chords, rest = plan_chords(self.board, safe)
+        start = mines[-1] if mines else self.rowcol
+        opens = [(rowcol, list(filter(self.board.is_unknown, self.board.neighbors(rowcol)))
+                  if rowcol in chords else None)
+                 for rowcol in plan_path(chords | rest, start)]
+        return mines, opens
+
+    def click_all(self, mines, opens):
+        """Makes the clicks planned by (plan_clicks)."""
+        self.mark_all(mines)
+        for rowcol, chorded in opens:
+            self.open_box(rowcol, chorded)
+
+    def open_box(self, rowcol, chorded=None):
+        """Opens the box at (rowcol), or, unless (chorded) is None, chords on
+        it to open the boxes of (chorded). Either way, the opened boxes only
+        count as revealed once the click is made. Like the other clicks, this
+        does not look at the board, so it can be made from another thread
+        while the board changes."""
+        if chorded is None:
+            self.reveal(rowcol)
+        else:
+            self.chord(rowcol)
+            self.add_revealed(chorded)
         
     def play_full(self):
+        """Plays until the game is over or the engine gets stuck. Returns the
+        reason for stopping, one of Agent.HIT_MINE, Agent.STUCK and Agent.DONE."""
+        profiler = self.profiler
         if self.board.all_hidden:
-            self.reveal_random()
+            with profiler.phase('actuation'):
+                self.reveal_random()
+            profiler.end_move()
         while True:
             if self.board.hit_mine:
-                print('[Agent] Exit reason: a mine was hit')
+                reason = self.HIT_MINE
                 break
-            mines, safe = self.engine.run()
+            with profiler.phase('engine'):
+                mines, safe = self.engine.run()
+            profiler.engine_run(self.engine, mines, safe)
             if not (mines or safe):
-                print('[Agent] Exit reason: engine not good enough.')
+                reason = self.STUCK
                 self.switch()
                 break
-            if self.board.remaining == 0:
-                self.mark_and_reveal(mines, self.board.unknown_rowcols)
-                print('[Agent] Exit reason: no more mines.')
+            done = self.board.remaining == 0
+            with profiler.phase('actuation'):
+                self.mark_and_reveal(mines, self.board.unknown_rowcols if done else safe)
+            profiler.end_move()
+            if done:
+                reason = self.DONE
                 break
-            else:
-                self.mark_and_reveal(mines, safe)
+        profiler.end_move()
+        if self.verbose:
+            print(f'[Agent] Exit reason: {reason}')
+        return reason
+
+    def play_pipelined(self):
+        """Like (play_full), but the clicks are made by a worker thread while
+        the engine goes on deducing from the marks it has made on the board.
+        What the engine finds while the clicker is busy is gathered into one
+        batch, which is planned and queued when the clicker is about to run
+        out of clicks, so that the batches get as many chords and as short
+        paths as those of (play_full).
+
+        The board is only synced when the engine needs the digits behind the
+        queued clicks, i.e. when it finds nothing or would only guess. The
+        clicks are then waited for until the ones left would take about as
+        long as a sync, as timed over the latest PIPELINE_TIMING_WINDOW ones,
+        so that the sync overlaps them and sees all of the others. Guesses are
+        taken back until all clicks are synced, so that they are made from all
+        of the digits, and the board is synced right after them."""
+        profiler = self.profiler
+        board = self.board
+        if board.all_hidden:
+            with profiler.phase('actuation'):
+                self.reveal_random()
+            profiler.end_move()
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(PIPELINE_SWITCH_INTERVAL)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(1) as clicker:
+                pending = deque()
+                # the marks found while the clicker was busy, not planned yet
+                batch_mines, batch_safe = set(), set()
+                # the durations of the latest queued clicks and syncs
+                click_times = deque(maxlen=PIPELINE_TIMING_WINDOW)
+                sync_times = deque(maxlen=PIPELINE_TIMING_WINDOW)
+
+                def mean(times):
+                    return sum(times) / len(times) if times else 0.0
+
+                def timed(function, *args):
+                    """Calls (function) with (args) on the clicker thread."""
+                    start = time.perf_counter()
+                    function(*args)
+                    click_times.append(time.perf_counter() - start)
+
+                def sync():
+                    start = time.perf_counter()
+                    self.sync_board()
+                    sync_times.append(time.perf_counter() - start)
+
+                def queue_batch():
+                    """Plans the clicks of the batch and queues them."""
+                    nonlocal batch_mines, batch_safe
+                    done = board.remaining == 0
+                    mines, opens = self.plan_clicks(
+                        batch_mines, board.unknown_rowcols if done else batch_safe)
+                    batch_mines, batch_safe = set(), set()
+                    if mines:
+                        pending.append(clicker.submit(timed, self.mark_all, mines))
+                    for rowcol, chorded in opens:
+                        pending.append(clicker.submit(timed, self.open_box, rowcol, chorded))
+
+                while True:
+                    if board.hit_mine:
+                        reason = self.HIT_MINE
+                        break
+                    with profiler.phase('engine'):
+                        mines, safe = self.engine.run()
+                    profiler.engine_run(self.engine, mines, safe)
+                    if (pending or batch_mines or batch_safe) and (
+                            self.engine.guessed or not (mines or safe)):
+                        for rowcol in mines | safe:
+                            board.unmark(rowcol)
+                        self.engine.notify(mines | safe)
+                        with profiler.phase('actuation'):
+                            if not pending:
+                                queue_batch()
+                            pending.popleft().result()
+                            click_time, sync_time = mean(click_times), mean(sync_times)
+                            while pending and (pending[0].done() or
+                                               len(pending) * click_time > sync_time):
+                                pending.popleft().result()
+                        if batch_mines or batch_safe:
+                            # The clicker will be done with the rest during the sync
+                            queue_batch()
+                        sync()
+                        profiler.end_move()
+                        continue
+                    if not (mines or safe):
+                        reason = self.STUCK
+                        self.switch()
+                        break
+                    batch_mines |= mines
+                    batch_safe |= safe
+                    done = board.remaining == 0
+                    if pending and not pending[-1].done() and not done:
+                        # There is time to find more before the clicker is idle
+                        continue
+                    queue_batch()
+                    profiler.end_move()
+                    if done or self.engine.guessed:
+                        # Nothing should be deduced from a guess before it
+                        # is seen to be right
+                        with profiler.phase('actuation'):
+                            while pending:
+                                pending.popleft().result()
+                        sync()
+                        profiler.end_move()
+                    if done:
+                        reason = self.DONE
+                        break
+        finally:
+            sys.setswitchinterval(switch_interval)
+        profiler.end_move()
+        if self.verbose:
+            print(f'[Agent] Exit reason: {reason}')
+        return reason
 
     def single_batch(self):
         mines, safe = self.engine.run()
         self.mark_and_reveal(mines, safe)
 
+class SimulatedAgent(Agent):
+    """An agent which plays a (Game) in-process instead of through the screen.
+    Its board must be a (Board.blank) one."""
+
+    def __init__(self, board, engine, game, verbose=False, profiler=None, log=None,
+                 click_delay=0.0, sync_delay=0.0):
+        """Every click takes (click_delay) seconds, like those of (pyautogui)
+        do, which pauses after each call, and every sync takes (sync_delay)
+        seconds, standing for the capture and classification of the screen."""
+        super().__init__(board, engine, verbose=verbose, profiler=profiler, log=log)
+        self.game = game
+        self.click_delay = click_delay
+        self.sync_delay = sync_delay
+        # the number of clicks, and the distance the cursor went in boxes
+        self.clicks = 0
+        self.travel = 0.0
+
+    def click(self):
+        self.clicks += 1
+        if self.click_delay:
+            time.sleep(self.click_delay)
+
+    def reveal(self, rowcol):
+        self.moveTo(rowcol)
+        self.click()
+        self.game.reveal(rowcol)
+        self.add_revealed([rowcol])
+
+    def mark(self, rowcol):
+        self.moveTo(rowcol)
+        self.click()
+        self.game.flag(rowcol)
+
+    def mark_all(self, rowcols):
+        for rowcol in rowcols:
+            self.mark(rowcol)
+
+    def chord(self, rowcol):
+        self.moveTo(rowcol)
+        self.click()
+        self.game.chord(rowcol)
+
+    def moveTo(self, rowcol):
+        if self.rowcol is not None:
+            self.travel += math.dist(self.rowcol, rowcol)
+        self.rowcol = rowcol
+
+    def _sync(self):
+        self.take_revealed()
+        if self.sync_delay:
+            with self.profiler.phase('capture'):
+                time.sleep(self.sync_delay)
+        with self.profiler.phase('classification'):
+            return self.board.apply(self.game.take_opened())
+
+    def switch(self):
+        pass
+
+    def msg(self, text):
+        pass
+
+    def reveal_random(self):
+        random_row = self.game.random.randrange(self.board.nrows)
+        random_col = self.game.random.randrange(self.board.ncols)
+        self.reveal((random_row, random_col))
+        self.sync_board()
+
+# Simulation
+# ════════════════════════════════════════
+
+class Game:
+    """An in-process model of a game of Minesweeper. The mines are laid out
+    at the first reveal, away from the revealed box, so the first click is
+    always safe. The layout only depends on (seed) and the first click."""
+
+    def __init__(self, nrows, ncols, N, seed=None):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.N = N
+        self.random = random.Random(seed)
+        self.mines = None # laid out at the first reveal
+        self.flags = set()
+        # maps the opened rowcols to their box values
+        self.opened = {}
+        # the rowcols opened since the last (take_opened). A (SimulatedAgent)
+        # may reveal from another thread than the one taking them, so both
+        # hold (_lock).
+        self._new = []
+        self._lock = threading.Lock()
+        self.hit_mine = False
+
+    def neighbors(self, rowcol):
+        row, col = rowcol
+        return [(nrow, ncol)
+                for nrow in range(max(row-1, 0), min(row+2, self.nrows))
+                for ncol in range(max(col-1, 0), min(col+2, self.ncols))
+                if (nrow, ncol) != rowcol]
+
+    def _lay_mines(self, first):
+        """Lays out the mines so that there are none at (first), nor around
+        it if there is enough room."""
+        rowcols = list(itertools.product(range(self.nrows), range(self.ncols)))
+        excluded = {first, *self.neighbors(first)}
+        if len(rowcols) - len(excluded) < self.N:
+            excluded = {first}
+        candidates = [rowcol for rowcol in rowcols if rowcol not in excluded]
+        self.mines = set(self.random.sample(candidates, self.N))
+
+    def value(self, rowcol):
+        """Returns the box value which is shown when (rowcol) is opened."""
+        if rowcol in self.mines:
+            return Board.HIT
+        count = sum(neigh in self.mines for neigh in self.neighbors(rowcol))
+        return count or Board.EMPTY
+
+    def reveal(self, rowcol):
+        """Opens the box at (rowcol). Like in the real game, opening an EMPTY
+        box opens its neighbors as well, and flagged boxes are left alone."""
+        with self._lock:
+            if self.mines is None:
+                self._lay_mines(rowcol)
+            queue = deque([rowcol])
+            while queue:
+                rowcol = queue.popleft()
+                if rowcol in self.opened or rowcol in self.flags:
+                    continue
+                value = self.opened[rowcol] = self.value(rowcol)
+                self._new.append(rowcol)
+                if value is Board.HIT:
+                    self.hit_mine = True
+                elif value is Board.EMPTY:
+                    queue.extend(self.neighbors(rowcol))
+
+    def flag(self, rowcol):
+        if rowcol not in self.opened:
+            self.flags.add(rowcol)
+
+    def chord(self, rowcol):
+        """Like clicking an opened digit: if as many of its neighbors are
+        flagged as it says, the others are opened."""
+        value = self.opened.get(rowcol)
+        if type(value) is not int:
+            return
+        neighbors = self.neighbors(rowcol)
+        if sum(neigh in self.flags for neigh in neighbors) == value:
+            for neigh in neighbors:
+                self.reveal(neigh)
+
+    def take_opened(self):
+        """Returns a mapping from the rowcols opened since the last call to
+        their box values."""
+        with self._lock:
+            new, self._new = self._new, []
+            return {rowcol: self.opened[rowcol] for rowcol in new}
+
+    @property
+    def won(self):
+        return (not self.hit_mine and
+                len(self.opened) == self.nrows * self.ncols - self.N)
+
+def simulate(engine_name, nrows, ncols, mines, ngames, seed=None, profiler=None,
+             pipelined=False, click_delay=0.0, log=None, sync_delay=0.0, **options):
+    """Plays (ngames) simulated games with the engine called (engine_name) and
+    prints the solve rate and per-move latency. Game i uses the seed (seed+i),
+    so runs with the same (seed) are reproducible. The moves are timed with
+    (profiler), and the positions appended to the (MoveLog) (log), if given.
+    The games are played with (Agent.play_pipelined) if
+    (pipelined) is true, and every click takes (click_delay) seconds and
+    every sync (sync_delay) seconds (see SimulatedAgent). (options) are
+    passed on to (make_engine)."""
+    seed = random.randrange(2**32) if seed is None else seed
+    wins = moves = clicks = 0
+    travel = 0.0
+    reasons = defaultdict(int)
+    start = time.perf_counter()
+    for i in range(ngames):
+        board = Board.blank(nrows, ncols, mines)
+        game = Game(nrows, ncols, mines, seed + i)
+        engine = make_engine(engine_name, board, verbose=False, **options)
+        if profiler is not None:
+            profiler.fields['game'] = seed + i
+        agent = SimulatedAgent(board, engine, game, profiler=profiler, log=log,
+                               click_delay=click_delay, sync_delay=sync_delay)
+        reasons[agent.play_pipelined() if pipelined else agent.play_full()] += 1
+        wins += game.won
+        moves += agent.moves
+        clicks += agent.clicks
+        travel += agent.travel
+    elapsed = time.perf_counter() - start
+    print(f'[simulate] seed: {seed}')
+    print(f'[simulate] games: {ngames}, won: {wins} ({wins/ngames:.1%})')
+    for reason, count in sorted(reasons.items()):
+        print(f'[simulate]   {reason}: {count}')
+    print(f'[simulate] games per minute: {ngames / elapsed * 60:.0f}')
+    if moves:
+        print(f'[simulate] moves: {moves}, per move: {elapsed / moves * 1000:.3f}ms')
+        print(f'[simulate] clicks per move: {clicks / moves:.2f}, '
+              f'cursor travel per move: {travel / moves:.2f} boxes')
+
+# Rendering
+# ════════════════════════════════════════
+
+# The color of the digits drawn on opened boxes. It does not matter for
+# classification, it only has to differ from the colors in Board.PALETTE.
+DIGIT_COLOR = (32, 74, 135)
+
+def render_board(values, box_size=30, gap=3, margin=40, hover=None, hit=None):
+    """Draws a synthetic screenshot of a GNOME Mines board. (values) is a 2D
+    sequence of box values, where Board.HIDDEN, Board.SAFE and Board.MINE
+    are drawn as hidden boxes, the last one with a mine flag. The boxes are
+    (box_size) pixels wide, have rounded corners, and are (gap) pixels apart
+    on a BORDER_COLOR background. The cursor hovers over the box at (hover),
+    if any, and (hit), if any, is drawn as a box with a mine which was
+    hit. Returns a pair (IMG, TOPLEFT) where TOPLEFT is the center pixel of
+    the top-left box."""
+    from PIL import Image, ImageDraw, ImageFont
+    nrows, ncols = len(values), len(values[0])
+    step = box_size + gap
+    img = Image.new('RGB', (2*margin + ncols*step - gap, 2*margin + nrows*step - gap),
+                    Board.BORDER_COLOR)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    background = {Board.EMPTY: Board.EMPTY_COLOR, Board.HIT: Board.NOTHIT_COLOR}
+    background.update((value, color) for color, value in Board.COLOR_MAP.items()
+                      if type(value) is int)
+    radius = max(box_size // 8, 1)
+    for row, col in itertools.product(range(nrows), range(ncols)):
+        value = values[row][col]
+        minx, miny = margin + col*step, margin + row*step
+        maxx, maxy = minx + box_size - 1, miny + box_size - 1
+        midx = (minx + maxx) // 2
+        if (row, col) in (hover, hit):
+            color = Board.CURSOR_COLOR
+        else:
+            color = background.get(value, Board.HIDDEN_COLOR)
+        draw.rounded_rectangle((minx, miny, maxx, maxy), radius, fill=color)
+        if (row, col) == hit:
+            inset = box_size // 4
+            draw.ellipse((minx+inset, miny+inset, maxx-inset, maxy-inset),
+                         fill=Board.HIT_COLOR)
+        elif value is Board.MINE:
+            # The pole along the middle vertical line, with the flag on top.
+            inset = box_size // 5
+            draw.line((midx, miny+inset, midx, maxy-inset), fill=Board.MINE_FLAG_COLOR)
+            draw.rectangle((midx+1, miny+inset, midx+inset, miny+2*inset),
+                           fill=Board.HIT_COLOR)
+        elif type(value) is int:
+            draw.text((midx, (miny+maxy)//2), str(value), fill=DIGIT_COLOR,
+                      font=font, anchor='mm')
+    topleft = (margin + box_size//2, margin + box_size//2)
+    return img, topleft
+
+# The colors of the synthetic desktop of (render_desktop)
+DESKTOP_COLOR = (30, 30, 60)
+TASKBAR_COLOR = (20, 20, 20)
+HEADER_BAR_COLOR = (222, 221, 218)
+OTHER_WINDOW_COLOR = (250, 250, 250)
+
+def render_desktop(img, topleft, header=38, taskbar=40, margin=120):
+    """Puts the window contents (img), as drawn by (render_board), on a
+    synthetic desktop: the window has a header bar (header) pixels high and
+    the mine counter written below the board, and it sits between another,
+    bright window and a taskbar (taskbar) pixels high, (margin) pixels from
+    the edges. The desktop is at least 1920x1080. Returns a pair (IMG,
+    TOPLEFT) like (render_board)."""
+    from PIL import Image, ImageDraw, ImageFont
+    width, height = img.size
+    desktop = Image.new('RGB', (max(width + 3*margin, 1920),
+                                max(height + header + taskbar + 2*margin, 1080)),
+                        DESKTOP_COLOR)
+    draw = ImageDraw.Draw(desktop)
+    draw.rectangle((margin//4, margin//4, margin//2 + 80, margin//2 + 60),
+                   fill=OTHER_WINDOW_COLOR)
+    draw.rectangle((0, desktop.height - taskbar, desktop.width, desktop.height),
+                   fill=TASKBAR_COLOR)
+    left, top = 2*margin, margin
+    draw.rectangle((left, top, left + width - 1, top + header - 1), fill=HEADER_BAR_COLOR)
+    desktop.paste(img, (left, top + header))
+    draw.text((left + width//2, top + header + height - 12), '12/99', fill=DIGIT_COLOR,
+              font=ImageFont.load_default(), anchor='mm')
+    return desktop, (topleft[0] + left, topleft[1] + top + header)
+
+def random_position(nrows, ncols, mines, seed=None):
+    """Returns a 2D list of the box values of a game in progress: a simulated
+    game with random clicks until about half of its safe boxes are open, with
+    about half of the mines next to opened boxes flagged."""
+    game = Game(nrows, ncols, mines, seed)
+    safe_count = nrows * ncols - mines
+    while len(game.opened) < safe_count // 2:
+        rowcol = (game.random.randrange(nrows), game.random.randrange(ncols))
+        if game.mines is None or rowcol not in game.mines:
+            game.reveal(rowcol)
+    values = [[Board.HIDDEN] * ncols for row in range(nrows)]
+    for (row, col), value in game.opened.items():
+        values[row][col] = value
+    for row, col in sorted(game.mines):
+        touches_opened = any(neigh in game.opened for neigh in game.neighbors((row, col)))
+        if touches_opened and game.random.random() < 0.5:
+            values[row][col] = Board.MINE
+    return values
+
+def bench_vision(seed=0, output=None):
+    """Times boundary detection, with and without a top-left pixel (see
+    detect_grid), and board updates on synthetic screenshots of various
+    board dimensions and box sizes, and checks that the detections agree
+    and that the updates classify every box correctly. The detection without
+    a top-left pixel is also timed on the board's window on a desktop (see
+    render_desktop). If (output) is a directory, the screenshots of the
+    corpus are saved there."""
+    dimensions = [(9, 9, 10), (16, 16, 40), (16, 30, 99), (50, 50, 500), (100, 100, 2000)]
+    box_sizes = [16, 24, 32]
+    print(f'{"board":>10} {"box":>4} {"boundaries":>11} {"grid":>9} {"desktop":>9} '
+          f'{"update":>9} {"dirty":>9} {"hover":>6} {"hit":>4}')
+    for (nrows, ncols, mines), box_size in itertools.product(dimensions, box_sizes):
+        name = f'{nrows}x{ncols}_{box_size}px'
+        values = random_position(nrows, ncols, mines, seed)
+        hidden_img, topleft = render_board([[Board.HIDDEN] * ncols] * nrows, box_size)
+        img, _ = render_board(values, box_size)
+        # ════════════════════════════════════════
+        # Boundary detection and full updates
+        board = Board(hidden_img, topleft, nrows, ncols, mines)
+        start = time.perf_counter()
+        board._set_boundaries(hidden_img, topleft, nrows, ncols)
+        boundaries_time = time.perf_counter() - start
+        def grid_fits(grid, dx=0, dy=0):
+            ybounds, xbounds = grid
+            return (len(ybounds) == nrows and len(xbounds) == ncols
+                    and all(board.boundaries[row, col]
+                            == Board.Boundary(ybounds[row][0] - dy, ybounds[row][1] - dy,
+                                              xbounds[col][0] - dx, xbounds[col][1] - dx)
+                            for row, col in board.rowcols))
+        start = time.perf_counter()
+        grid = detect_grid(img)
+        grid_time = time.perf_counter() - start
+        grid_ok = grid_fits(grid)
+        desktop_img, desktop_topleft = render_desktop(img, topleft)
+        start = time.perf_counter()
+        try:
+            grid = detect_grid(desktop_img)
+        except ValueError:
+            grid = ([], [])
+        desktop_time = time.perf_counter() - start
+        desktop_ok = grid_fits(grid, desktop_topleft[0] - topleft[0],
+                               desktop_topleft[1] - topleft[1])
+        start = time.perf_counter()
+        board.update(img)
+        update_time = time.perf_counter() - start
+        expected = {Board.SAFE: Board.HIDDEN}
+        wrong = sum(board[row, col] != expected.get(value, value)
+                    for row, col in board.rowcols
+                    for value in [values[row][col]])
+        # ════════════════════════════════════════
+        # A dirty update of a 3x3 block of boxes
+        rowcols = set(board.neighbors((nrows//2, ncols//2))) | {(nrows//2, ncols//2)}
+        region = board.region(rowcols)
+        left, top, width, height = region
+        crop = img.crop((left, top, left+width, top+height))
+        start = time.perf_counter()
+        board.update(crop, region[:2], rowcols)
+        dirty_time = time.perf_counter() - start
+        # ════════════════════════════════════════
+        # The cursor hover and hit mine variants
+        hidden = sorted(board.hidden_rowcols)
+        hover = hidden[len(hidden)//2] if hidden else None
+        hover_img, _ = render_board(values, box_size, hover=hover)
+        hover_ok = hover is None or board.classify(hover_img)[hover] == Board.HIDDEN_CODE
+        hit_img, _ = render_board(values, box_size, hit=hover)
+        hit_ok = (hover is None or
+                  Board(hidden_img, topleft, nrows, ncols, mines).update(hit_img) is None)
+        print(f'{nrows:>4}x{ncols:<5} {box_size:>4} {boundaries_time*1000:>9.2f}ms '
+              f'{grid_time*1000:>7.2f}ms{"" if grid_ok else "!"} '
+              f'{desktop_time*1000:>7.2f}ms{"" if desktop_ok else "!"} '
+              f'{update_time*1000:>7.2f}ms {dirty_time*1000:>7.2f}ms '
+              f'{"ok" if hover_ok else "FAIL":>6} {"ok" if hit_ok else "FAIL":>4}'
+              + (f'  {wrong} boxes misclassified' if wrong else ''))
+        if output is not None:
+            img.save(os.path.join(output, f'{name}.png'), 'PNG')
+            hidden_img.save(os.path.join(output, f'{name}_hidden.png'), 'PNG')
+            hover_img.save(os.path.join(output, f'{name}_hover.png'), 'PNG')
+            hit_img.save(os.path.join(output, f'{name}_hit.png'), 'PNG')
+            desktop_img.save(os.path.join(output, f'{name}_desktop.png'), 'PNG')
+
+# Benchmarks
+# ════════════════════════════════════════
+
+# The board sizes of the engine benchmarks, as (NAME, NROWS, NCOLS)
+BENCH_SIZES = [('beginner', 9, 9), ('intermediate', 16, 16), ('expert', 16, 30),
+               ('large', 50, 50)]
+# The mine densities of the benchmark positions. The middle one is that of
+# intermediate games, the last one that of expert games.
+BENCH_DENSITIES = [0.12, 0.16, 0.21]
+# The positions per size and density
+BENCH_POSITIONS = 3
+# The engines which are benchmarked when none are named
+BENCH_ENGINES = ['groups', 'linear', 'brute', 'groups+brute', 'solver']
+# Every position is solved this many times and the fastest time is kept,
+# unless the engine runs out of time
+BENCH_REPEATS = 3
+# The seconds an engine has for a position (see SequenceEngine)
+BENCH_BUDGET = 5.0
+# The file which holds the baselines of (bench_engines)
+BENCH_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks.json')
+# A case regresses when it takes this many times its baseline time and at
+# least BENCH_TIME_SLACK seconds more, or this many times its baseline peak
+# memory and at least BENCH_MEMORY_SLACK bytes more. The slacks keep the
+# timer's noise on tiny cases from failing them. Even the fastest of a few
+# runs varies by up to 1.7 times on a busy virtual machine.
+BENCH_TIME_TOLERANCE = 2.0
+BENCH_TIME_SLACK = 0.002
+BENCH_MEMORY_TOLERANCE = 1.25
+BENCH_MEMORY_SLACK = 64 * 1024
+
+def wide_frontier_position(nrows, ncols, mines, seed=None):
+    """Returns a 2D list of the box values of a game in which only two rows
+    across the middle are open, three rows apart, with their mines flagged.
+    Every box of the two hidden rows between them touches up to six D-boxes,
+    but the constraints are too loose to force much, so the frontier forms
+    components as wide as the board with tens of thousands of solutions,
+    the worst case of the engines which enumerate components."""
+    game = Game(nrows, ncols, mines, seed)
+    game._lay_mines((0, 0))
+    values = [[Board.HIDDEN] * ncols for row in range(nrows)]
+    for row, col in itertools.product((nrows//2 - 2, nrows//2 + 1), range(ncols)):
+        values[row][col] = Board.MINE if (row, col) in game.mines else game.value((row, col))
+    return values
+
+def bench_positions(seed=0):
+    """Returns the positions of the engine benchmarks as a dict mapping the
+    name of every case to a list of pairs (CODES, N) (see Board.from_codes).
+    There are BENCH_POSITIONS games in progress (see random_position) per
+    size of BENCH_SIZES and density of BENCH_DENSITIES, and a
+    (wide_frontier_position) per size. The positions only depend on (seed)."""
+    def codes(values):
+        return np.array([[Board.CODES[value] for value in row] for row in values],
+                        dtype=np.int8)
+    cases = {}
+    for name, nrows, ncols in BENCH_SIZES:
+        for density in BENCH_DENSITIES:
+            mines = round(nrows * ncols * density)
+            cases[f'{name}/{density}'] = [
+                (codes(random_position(nrows, ncols, mines, seed + i)), mines)
+                for i in range(BENCH_POSITIONS)]
+        mines = round(nrows * ncols * BENCH_DENSITIES[-1])
+        cases[f'{name}/wide'] = [(codes(wide_frontier_position(nrows, ncols, mines, seed)),
+                                  mines)]
+    return cases
+
+def bench_case(positions, engine_name, **options):
+    """Runs the engine called (engine_name) on (positions), a list of pairs
+    (CODES, N), each time on a new board and engine. Returns a dict with the
+    total of the fastest times of the positions out of BENCH_REPEATS runs,
+    the peak memory of a run, the number of configurations enumerated, the
+    number of boxes found and the number of components which timed out (see
+    component_stats). The times are the CPU time of this process, which
+    unlike the time on the clock does not count the time the process waits
+    while others run. (options) are passed on to (make_engine)."""
+    total = 0.0
+    memory = configurations = found = timeouts = 0
+    for codes, N in positions:
+        times = []
+        for repeat in range(BENCH_REPEATS):
+            engine = make_engine(engine_name, Board.from_codes(codes, N), verbose=False,
+                                 budget=BENCH_BUDGET, **options)
+            start = time.process_time()
+            mines, safe = engine.run()
+            times.append(time.process_time() - start)
+            records = engine.stats['engines']
+            if any(record.get('timeouts') for record in records):
+                # Another run would only take the whole budget again
+                break
+        total += min(times)
+        found += len(mines) + len(safe)
+        for record in records:
+            configurations += record.get('configurations', 0)
+            timeouts += record.get('timeouts', 0)
+        # Tracing slows the engines down, so memory gets a run of its own
+        engine = make_engine(engine_name, Board.from_codes(codes, N), verbose=False,
+                             budget=BENCH_BUDGET, **options)
+        tracemalloc.start()
+        try:
+            engine.run()
+            memory = max(memory, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return {'time': total, 'memory': memory, 'configurations': configurations,
+            'found': found, 'timeouts': timeouts}
+
+def bench_regressions(result, baseline):
+    """Returns a list of the ways in which (result) regressed from
+    (baseline), both as returned by (bench_case). The configurations and
+    the boxes found are compared exactly, unless a component timed out. Once
+    the baseline has timeouts, how many there are depends on the speed of
+    the machine, so only new timeouts count."""
+    regressions = []
+    if (result['time'] > baseline['time'] * BENCH_TIME_TOLERANCE
+            and result['time'] - baseline['time'] > BENCH_TIME_SLACK):
+        regressions.append(f'time {baseline["time"]*1000:.2f}ms -> '
+                           f'{result["time"]*1000:.2f}ms')
+    if (result['memory'] > baseline['memory'] * BENCH_MEMORY_TOLERANCE
+            and result['memory'] - baseline['memory'] > BENCH_MEMORY_SLACK):
+        regressions.append(f'memory {baseline["memory"]//1024}KB -> '
+                           f'{result["memory"]//1024}KB')
+    if result['timeouts'] and not baseline['timeouts']:
+        regressions.append(f'timeouts {baseline["timeouts"]} -> {result["timeouts"]}')
+    elif not result['timeouts'] and not baseline['timeouts']:
+        for key in ('configurations', 'found'):
+            if result[key] != baseline[key]:
+                regressions.append(f'{key} {baseline[key]} -> {result[key]}')
+    return regressions
+
+def bench_engines(engine_names=None, baseline=BENCH_FILE, output=None, **options):
+    """Times the engines called (engine_names), or BENCH_ENGINES, on the
+    benchmark positions (see bench_positions and bench_case), and compares
+    them with the baselines in the JSON file at (baseline), if it exists.
+    Exits with status 1 if any case regressed (see bench_regressions). The
+    results are saved as the new baselines to (output), if given. Timings
+    only compare meaningfully with baselines made on the same machine.
+    (options) are passed on to (make_engine)."""
+    baselines = {}
+    if baseline is not None and os.path.exists(baseline):
+        with open(baseline) as file:
+            baselines = json.load(file)
+    results = {}
+    failed = []
+    print(f'{"case":>20} {"engine":>14} {"time":>11} {"memory":>9} '
+          f'{"configurations":>14} {"found":>6}')
+    for case, positions in bench_positions().items():
+        for engine_name in engine_names or BENCH_ENGINES:
+            key = f'{case}/{engine_name}'
+            result = results[key] = bench_case(positions, engine_name, **options)
+            regressions = (bench_regressions(result, baselines[key])
+                           if key in baselines else ['no baseline'])
+            if key in baselines and regressions:
+                failed.append(key)
+            print(f'{case:>20} {engine_name:>14} {result["time"]*1000:>9.2f}ms '
+                  f'{result["memory"]//1024:>7}KB {result["configurations"]:>14} '
+                  f'{result["found"]:>6}'
+                  + (f' ({result["timeouts"]} timeouts)' if result['timeouts'] else '')
+                  + (f'  {"; ".join(regressions)}' if regressions else ''))
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+        print(f'[bench] baselines saved to {output}')
+    if failed:
+        print(f'[bench] REGRESSED: {len(failed)} of {len(results)} cases: {", ".join(failed)}')
+        sys.exit(1)
+    print(f'[bench] {len(results)} cases, no regressions')
+
+# Maps engine names to functions which make the engine for a board, given
+# the options passed to (make_engine). Names joined with '+' make a
+# (SequenceEngine), e.g. "groups+brute".
+ENGINES = {
+    "groups": lambda board, **options: GroupsEngine(board),
+    "linear": lambda board, **options: LinearEngine(board),
+    "patterns": lambda board, **options: PatternEngine(board),
+    "brute": lambda board, **options: BruteForceEngine(board, False, **options),
+    "brute_risky": lambda board, **options: BruteForceEngine(board, True, **options),
+    "solver": lambda board, **options: SolverEngine(board, False, **options),
+    "solver_risky": lambda board, **options: SolverEngine(board, True, **options),
+    "probability": lambda board, **options: ProbabilityEngine(board, False, **options),
+    "probability_risky": lambda board, **options: ProbabilityEngine(board, True, **options),
+}
+
+# Maps the names of engine chains to the chains they stand for. The local
+# patterns resolve most moves before the groups are brought up to date, and
+# brute force only gets what the linear reduction leaves.
+ENGINE_ALIASES = {
+    "groups+brute": "patterns+groups+linear+brute",
+    "groups+brute_risky": "patterns+groups+linear+brute_risky",
+}
+
+def make_engine(name, board, verbose=True, budget=None, **options):
+    """Returns the engine called (name), or the chain which it is an alias of
+    (see ENGINE_ALIASES), for (board). (options) are passed on
+    to the engines, e.g. (workers), (cache_size) and (samples). If (budget)
+    is not None, the engines are given that many seconds per move (see
+    SequenceEngine)."""
+    engines = []
+    name = ENGINE_ALIASES.get(name, name)
+    for part in name.split('+'):
+        if part not in ENGINES:
+            raise ValueError(f'Unknown engine: {part}')
+        engines.append(ENGINES[part](board, **options))
+    if len(engines) == 1 and budget is None:
+        return engines[0]
+    return SequenceEngine(engines, verbose, budget)
+
+Options = namedtuple('Options', 'command engine nrows ncols mines dirty ngames seed output '
+                                 'workers cache_size budget samples profile pipelined '
+                                 'click_delay sync_delay log image topleft corpus calibration')
+
 def parse_args():
-    optlist, args = getopt.getopt(sys.argv[1:], 'c:e:d:m:')
+    optlist, args = getopt.getopt(sys.argv[1:], 'c:e:d:m:n:o:j:',
+                                  ['dirty', 'seed=', 'cache=', 'budget=', 'samples=',
+                                   'profile=', 'pipelined', 'click-delay=', 'sync-delay=',
+                                   'log=', 'image=', 'topleft=', 'corpus=', 'calibration='])
     opts = dict(optlist)
-    nrows, ncols = map(int, opts['-d'].split(','))
-    mines = int(opts['-m'])
-    command = opts['-c']
-    engine = opts['-e']
-    return command, engine, nrows, ncols, mines
+    nrows, ncols = map(int, opts['-d'].split(',')) if '-d' in opts else (None, None)
+    mines = int(opts['-m']) if '-m' in opts else None
+    return Options(command=opts['-c'],
+                   engine=opts.get('-e'),
+                   nrows=nrows, ncols=ncols, mines=mines,
+                   dirty='--dirty' in opts,
+                   ngames=int(opts.get('-n', 1000)),
+                   seed=int(opts['--seed']) if '--seed' in opts else None,
+                   output=opts.get('-o'),
+                   workers=int(opts.get('-j', 1)),
+                   cache_size=int(opts.get('--cache', DEFAULT_CACHE_SIZE)),
+                   budget=float(opts['--budget']) if '--budget' in opts else None,
+                   samples=int(opts.get('--samples', DEFAULT_SAMPLES)),
+                   profile=opts.get('--profile'),
+                   pipelined='--pipelined' in opts,
+                   click_delay=float(opts.get('--click-delay', 0)),
+                   sync_delay=float(opts.get('--sync-delay', 0)),
+                   log=opts.get('--log'),
+                   image=opts.get('--image'),
+                   topleft=(tuple(map(int, opts['--topleft'].split(',')))
+                            if '--topleft' in opts else None),
+                   corpus=opts.get('--corpus'),
+                   calibration=opts.get('--calibration', CALIBRATION_FILE) or None)
+
+def read_board(img, topleft, nrows, ncols, mines, calibration=None):
+    """Returns the board of (mines) mines in the screenshot (img). If (topleft),
+    a pixel within the top-left box, is given, the grid is walked from there
+    (see Board). Otherwise it is found by (Board.calibrated), which caches it
+    in the file at (calibration), if given."""
+    if topleft is not None:
+        return Board(img, topleft, nrows, ncols, mines)
+    return Board.calibrated(img, mines, nrows, ncols, calibration)
+
+def solve_image(path, topleft, nrows, ncols, mines, engine_name, output,
+                calibration=None, **engine_options):
+    """Reads the board from the screenshot saved at (path) (see read_board),
+    runs the engine called (engine_name) on it and saves the screenshot
+    annotated as in the show_ripe command to (output). Does not touch the
+    screen."""
+    from PIL import Image
+    img = Image.open(path).convert('RGB')
+    board = read_board(img, topleft, nrows, ncols, mines, calibration)
+    engine = make_engine(engine_name, board, **engine_options)
+    mines, safe = engine.run()
+    board.annotate(mines, safe).save(output, "PNG")
+    print(f'[solve] {len(mines)} mines, {len(safe)} safe -> {output}')
 
 def get_board(nrows, ncols, mines):
     time.sleep(2)
@@ -632,44 +3453,75 @@ def update_board(board):
 # ════════════════════════════════════════
 
 def main():
+    opts = parse_args()
+    profiler = Profiler(opts.profile)
+    # The replay command reads the log instead of writing it
+    log = MoveLog(opts.log) if opts.log and opts.command != "replay" else None
+    try:
+        run_command(opts, profiler, log)
+    finally:
+        profiler.close()
+        if log is not None:
+            log.close()
+
+def run_command(opts, profiler, log):
+    command = opts.command
+    engine_options = dict(workers=opts.workers, cache_size=opts.cache_size,
+                          budget=opts.budget, samples=opts.samples)
+    if command == "simulate":
+        simulate(opts.engine, opts.nrows, opts.ncols, opts.mines, opts.ngames, opts.seed,
+                 profiler, opts.pipelined, opts.click_delay, log, opts.sync_delay,
+                 **engine_options)
+        return
+    elif command == "replay":
+        replay(opts.log, opts.engine, **engine_options)
+        return
+    elif command == "bench_vision":
+        bench_vision(opts.seed or 0, opts.output)
+        return
+    elif command == "make_patterns":
+        make_patterns(opts.nrows, opts.ncols, opts.mines, opts.ngames, opts.seed or 0,
+                      opts.output or PATTERNS_FILE)
+        return
+    elif command == "batch":
+        screenshot = (opts.topleft, (opts.nrows, opts.ncols), opts.mines)
+        batch(opts.corpus, opts.engine, opts.workers, screenshot, opts.output,
+              cache_size=opts.cache_size, budget=opts.budget, samples=opts.samples)
+        return
+    elif command == "bench_engines":
+        bench_engines(opts.engine.split(',') if opts.engine else None,
+                      output=opts.output, workers=opts.workers, cache_size=opts.cache_size,
+                      samples=opts.samples)
+        return
+    elif command == "solve":
+        solve_image(opts.image, opts.topleft, opts.nrows, opts.ncols, opts.mines,
+                    opts.engine, opts.output or "solve_result.png", opts.calibration,
+                    **engine_options)
+        return
     # Creating the board
     # ══════════════════════════════
     time.sleep(2)
-    command, engine, rows, cols, mines = parse_args()
-    topleft = pyautogui.position()
     pyautogui.move((-100,-100)) # so that the cursor is not on a box
     img = pyautogui.screenshot()
-    board = Board(img, topleft, rows, cols, mines)
+    board = read_board(img, opts.topleft, opts.nrows, opts.ncols, opts.mines,
+                       opts.calibration)
     # Picking the engine.
     # ══════════════════════════════
-    if engine == "groups":
-        engine = GroupsEngine(board)
-    elif engine == "brute":
-        engine = BruteForceEngine(board)
-    elif engine == "brute_risky":
-        engine = BruteForceEngine(board, risky=True)
-    elif engine == "groups+brute":
-        engine = SequenceEngine([GroupsEngine(board), BruteForceEngine(board)])
-    elif engine == "groups+brute_risky":
-        engine = SequenceEngine([GroupsEngine(board), BruteForceEngine(board, risky=True)])
+    engine = make_engine(opts.engine, board, **engine_options)
     # Running the command.
     # ══════════════════════════════
     if command == "play_full":
-        agent = Agent(board, engine)
-        agent.run()
+        agent = Agent(board, engine, opts.dirty, profiler=profiler, log=log)
+        if opts.pipelined:
+            agent.play_pipelined()
+        else:
+            agent.play_full()
     elif command == "show_ripe":
         mines, safe = engine.run()
-        img = board.last_update_img
-        draw = ImageDraw.Draw(img)
-        for rowcol in mines:
-            b = board.boundaries[rowcol]
-            draw.rectangle((b.minx, b.miny, b.maxx, b.maxy), (0,0,0))
-        for rowcol in safe:
-            b = board.boundaries[rowcol]
-            draw.rectangle((b.minx, b.miny, b.maxx, b.maxy), (0,38,255))
+        img = board.annotate(mines, safe)
         img.save("show_ripe_result.png", "PNG")
     elif command == "single_batch":
-        agent = Agent(board, engine)
+        agent = Agent(board, engine, opts.dirty, profiler=profiler, log=log)
         agent.single_batch()
         
 if __name__ == "__main__":